@@ -0,0 +1,50 @@
+"""
+Measures how computing the metric categories scales with the number of worker threads.
+
+    $ python -m benchmarks.bench_categories
+"""
+import argparse
+import os
+import timeit
+
+from helpers.data_cleaning import clean_df_for_cr
+from helpers.data_ranking import analyze_and_rank_categories
+from .synthetic_data import make_catalog, make_trial_data
+
+
+def assert_same_results(expected, actual):
+    assert list(expected) == list(actual)
+    for category in expected:
+        for expected_df, actual_df in zip(expected[category], actual[category]):
+            assert expected_df.equals(actual_df), f"Results differ for category '{category}'."
+
+
+def bench_categories(n_cultivars, metrics_per_category, max_workers, repeat):
+    catalog = make_catalog(metrics_per_category)
+    raw_df = make_trial_data(catalog, n_cultivars, n_locations=1, n_seasons=1)
+    data_frame = clean_df_for_cr(raw_df, catalog)
+    print(f"{len(data_frame)} cultivars, {len(catalog)} metrics")
+
+    expected = analyze_and_rank_categories(data_frame, catalog, 'protein_content')
+    baseline = None
+    for workers in range(1, max_workers + 1):
+        assert_same_results(expected, analyze_and_rank_categories(data_frame, catalog, 'protein_content', workers))
+        timing = min(timeit.repeat(lambda: analyze_and_rank_categories(data_frame, catalog, 'protein_content', workers),
+                                   number=1, repeat=repeat))
+        baseline = baseline or timing
+        print(f"{workers:>3} workers  {timing:.3f}s  speedup {baseline / timing:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cultivars', type=int, default=5000)
+    parser.add_argument('--metrics-per-category', type=int, default=40)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count())
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    bench_categories(args.cultivars, args.metrics_per_category, args.max_workers, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
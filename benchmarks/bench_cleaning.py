@@ -0,0 +1,40 @@
+"""
+Measures the overhead of collecting the data-quality report while cleaning.
+
+    $ python -m benchmarks.bench_cleaning
+"""
+import argparse
+import timeit
+
+from helpers.data_cleaning import clean_df_for_cr
+from .synthetic_data import make_catalog, make_trial_data
+
+
+def bench_cleaning(n_cultivars, metrics_per_category, repeat):
+    catalog = make_catalog(metrics_per_category)
+    data_frame = make_trial_data(catalog, n_cultivars)
+
+    timings = {}
+    for name, make_report in [('without report', lambda: None), ('with report', list)]:
+        timings[name] = min(timeit.repeat(lambda: clean_df_for_cr(data_frame.copy(), catalog, make_report()),
+                                          number=1, repeat=repeat))
+
+    overhead = timings['with report'] / timings['without report'] - 1
+    print(f"{len(data_frame):>8} rows  {len(catalog):>4} metrics  "
+          f"without report {timings['without report']:.3f}s  with report {timings['with report']:.3f}s  "
+          f"overhead {overhead:+.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cultivars', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--metrics-per-category', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for n_cultivars in args.cultivars:
+        bench_cleaning(n_cultivars, args.metrics_per_category, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Load/soak test simulating concurrent sessions of the Cultivar Ranker app.
+
+    $ python -m benchmarks.load_test --sessions 8 --iterations 5
+
+Each session drives cultivar_ranker.py headlessly with Streamlit's AppTest, against local fixture CSVs
+standing in for the Google Sheets, repeating a realistic sequence of widget interactions: picking the crop,
+location and season, moving sliders, Equalize and Reset. Sessions run concurrently in one process, like on
+the Streamlit server, so they share its caches. Reports latency percentiles per interaction, and the CPU time
+and resident memory of the whole process, also averaged per session (sessions share one process and its
+caches, so they cannot be measured separately).
+"""
+import argparse
+import os
+import random
+import resource
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from streamlit.testing.v1 import AppTest
+
+from helpers.data_loading import LOCAL_DATA_DIR_ENV
+from .synthetic_data import make_catalog, make_trial_data
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_SCRIPT = os.path.join(APP_DIR, 'cultivar_ranker.py')
+FIXTURE_SHEET_ID = 'fixture'
+SLIDERS = ['boundary', 'crop_yield', 'quality', 'diseases', 'agronomist', 'abiotic', 'weeds', 'morphological']
+
+
+def write_fixtures(data_dir, n_cultivars, metrics_per_category):
+    """Writes the catalog and crop sheets as CSVs, laid out as get_sheet_url expects them."""
+    sheet_dir = os.path.join(data_dir, FIXTURE_SHEET_ID)
+    os.makedirs(sheet_dir, exist_ok=True)
+
+    catalog = make_catalog(metrics_per_category)
+    catalog.to_csv(os.path.join(sheet_dir, 'Metrics catalog.csv'), index=False)
+    for sheet, crop in [('Wheat', 'wheat'), ('Wheat relatives', 'spelt'), ('Peas', 'peas')]:
+        df = make_trial_data(catalog, n_cultivars, crop=crop)
+        # seasons are stored like '2020/2021' in the sheets
+        df['season'] = df['season'].map(lambda x: f'{x}/{x + 1}')
+        df.to_csv(os.path.join(sheet_dir, f'{sheet}.csv'), index=False)
+
+
+def get_selectbox(app, label):
+    return next(x for x in app.selectbox if x.label == label)
+
+
+def get_button(app, label):
+    return next(x for x in app.button if x.label == label)
+
+
+def interactions(rng):
+    """A session's sequence of (interaction name, action on the AppTest)."""
+    yield 'pick_crop', lambda app: get_selectbox(app, '**Pick the crop**').select_index(
+        rng.randrange(len(get_selectbox(app, '**Pick the crop**').options)))
+    yield 'pick_location', lambda app: get_selectbox(app, '**Pick the location**').select_index(
+        rng.randrange(len(get_selectbox(app, '**Pick the location**').options)))
+    yield 'pick_season', lambda app: get_selectbox(app, '**Pick the season**').select_index(
+        rng.randrange(len(get_selectbox(app, '**Pick the season**').options)))
+    yield 'equalize', lambda app: get_button(app, 'Equalize').click()
+    for slider in rng.sample(SLIDERS, 3):
+        yield 'move_slider', lambda app, slider=slider: app.slider(key=slider).set_value(rng.randint(0, 100))
+    yield 'reset', lambda app: get_button(app, 'Reset to 0').click()
+
+
+def run_session(session_id, iterations, timeout, latencies, errors):
+    rng = random.Random(session_id)
+    app = AppTest.from_file(APP_SCRIPT, default_timeout=timeout)
+    app.secrets['sheet_ids'] = [FIXTURE_SHEET_ID]
+
+    start = time.perf_counter()
+    try:
+        app.run()
+    except Exception:
+        errors['page_load'] += 1
+        return
+    latencies['page_load'].append(time.perf_counter() - start)
+    if app.exception:
+        # the widgets the interactions need are not rendered
+        errors['page_load'] += 1
+        return
+
+    for _ in range(iterations):
+        for name, action in interactions(rng):
+            try:
+                action(app)
+                start = time.perf_counter()
+                app.run()
+                latencies[name].append(time.perf_counter() - start)
+                if app.exception:
+                    errors[name] += 1
+            except Exception:
+                errors[name] += 1
+
+
+def get_rss_mb():
+    """Current resident memory of the process in MB (Linux), falling back to the peak."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+
+def report(latencies, errors, n_sessions, wall_time, cpu_time, rss_before, rss_peak):
+    print(f"{'interaction':<14}{'count':>7}{'errors':>8}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    # interactions that only failed (e.g. a page load raising) are listed too, without latencies
+    for name in list(latencies) + [x for x in errors if x not in latencies]:
+        values = latencies.get(name, [])
+        p50, p90, p99, p100 = np.percentile(np.array(values) * 1000, [50, 90, 99, 100]) if values else [np.nan] * 4
+        print(f"{name:<14}{len(values):>7}{errors[name]:>8}{p50:>9.0f}{p90:>9.0f}{p99:>9.0f}{p100:>9.0f}")
+
+    n_interactions = sum(len(x) for x in latencies.values())
+    print(f"\n{n_sessions} sessions, {n_interactions} interactions in {wall_time:.1f}s "
+          f"({n_interactions / wall_time:.1f} interactions/s)")
+    print(f"process CPU: {cpu_time:.2f}s total, {cpu_time / n_sessions:.2f}s average per session")
+    print(f"process resident memory: {rss_before:.0f} MB before, {rss_peak:.0f} MB peak, "
+          f"{(rss_peak - rss_before) / n_sessions:.1f} MB average growth per session")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=3, help='interaction sequences per session')
+    parser.add_argument('--cultivars', type=int, default=50)
+    parser.add_argument('--metrics-per-category', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=120, help='seconds allowed per script run')
+    args = parser.parse_args()
+
+    os.chdir(APP_DIR)
+    with tempfile.TemporaryDirectory() as data_dir:
+        write_fixtures(data_dir, args.cultivars, args.metrics_per_category)
+        os.environ[LOCAL_DATA_DIR_ENV] = data_dir
+
+        latencies, errors = defaultdict(list), defaultdict(int)
+        rss_before, rss_peak = get_rss_mb(), get_rss_mb()
+        done = threading.Event()
+
+        def sample_rss():
+            nonlocal rss_peak
+            while not done.wait(0.2):
+                rss_peak = max(rss_peak, get_rss_mb())
+
+        sampler = threading.Thread(target=sample_rss, daemon=True)
+        sampler.start()
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+            futures = [executor.submit(run_session, i, args.iterations, args.timeout, latencies, errors)
+                       for i in range(args.sessions)]
+            for future in futures:
+                future.result()
+        wall_time, cpu_time = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        done.set()
+        sampler.join()
+
+    report(latencies, errors, args.sessions, wall_time, cpu_time, rss_before, max(rss_peak, get_rss_mb()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from helpers.data_ranking import CATEGORIES
+
+
+def make_catalog(metrics_per_category=5):
+    """Metrics catalog in the same shape as the 'Metrics catalog' sheet, after column standardization."""
+    rows = [(x, 'id', 'object', np.nan) for x in ['trial_id', 'genotype', 'crop', 'location', 'plot_id',
+                                                  'experiment_type', 'exclude_from_analysis']]
+    rows += [('season', 'id', 'integer', np.nan),
+             ('protein_content', 'quality', 'float', False),
+             ('date_of_emergence', 'agronomist', 'date', np.nan),
+             ('date_of_heading', 'agronomist', 'date', np.nan),
+             ('days_between_emergence_and_heading', 'agronomist', 'float', True)]
+    for category in CATEGORIES:
+        rows += [(f'{category}_metric_{i}', category, 'float' if i % 2 else 'integer', bool(i % 3))
+                 for i in range(metrics_per_category)]
+
+    catalog = pd.DataFrame(rows, columns=['metric', 'type', 'data_type', 'rank_ascending'])
+    catalog['explanation'] = 'Synthetic metric.'
+    return catalog
+
+
+def make_trial_data(catalog, n_cultivars=100, n_locations=3, n_seasons=3, n_plots=3, crop='wheat', seed=0):
+    """Raw per-plot trial rows for the metrics in @catalog, in the shape of the crop sheets."""
+    rng = np.random.default_rng(seed)
+    keys = pd.MultiIndex.from_product([[f'cultivar_{i}' for i in range(n_cultivars)],
+                                       [f'location_{i}' for i in range(n_locations)],
+                                       list(range(2020, 2020 + n_seasons)),
+                                       [f'plot_{i}' for i in range(n_plots)]],
+                                      names=['genotype', 'location', 'season', 'plot_id']).to_frame(index=False)
+    n = len(keys)
+
+    data = {'crop': crop, 'experiment_type': 'trial',
+            'trial_id': keys.location + '_' + keys.season.astype(str),
+            'exclude_from_analysis': rng.random(n) < 0.02}
+    emergence = pd.to_datetime(keys.season.astype(str) + '-03-01') + pd.to_timedelta(rng.integers(0, 14, n), 'D')
+    data['date_of_emergence'] = emergence.dt.strftime('%B %d, %Y')
+    data['date_of_heading'] = (emergence + pd.to_timedelta(rng.integers(55, 75, n), 'D')).dt.strftime('%B %d, %Y')
+
+    metrics = catalog[catalog.rank_ascending.notna() & (catalog.data_type != 'date')]
+    for metric, data_type in zip(metrics.metric, metrics.data_type):
+        if metric in ['days_between_emergence_and_heading']:
+            continue
+        values = rng.normal(50, 10, n)
+        values[rng.random(n) < 0.05] = np.nan
+        data[metric] = values.round() if data_type == 'integer' else values
+
+    return pd.concat([keys, pd.DataFrame(data)], axis='columns')
@@ -2,15 +2,19 @@ import os
 import numpy as np
 import pandas as pd
 from PIL import Image
-import matplotlib.pyplot as plt
-from helpers.data_loading import get_dfs_for_cultivar_ranker, load_csv_file, get_sheet_url
-from helpers.data_cleaning import clean_df_for_cr, remove_listed_columns, remove_columns_with_all_nas
+from helpers.data_loading import get_dfs_for_cultivar_ranker
+from helpers.data_cleaning import filter_selection
 from helpers.data_metrics import get_boundary_metric
-from helpers.data_ranking import analyze_and_rank, weighted_overall_rank
-from helpers.data_visualizing import visualize_metrics
+from helpers.data_ranking import get_overall_ranks, weighted_overall_rank
+from helpers.data_visualizing import visualize_metrics, show_rank_table
 from helpers.streamlit_functions import (select_user_parameters,
                                          select_ranking_importance_for_metrics,
-                                         present_wheat_class)
+                                         present_wheat_class,
+                                         cached_rank_selection,
+                                         present_export_bundle,
+                                         present_cultivar_trends,
+                                         present_similar_cultivars,
+                                         present_quality_report)
 # from helpers.product_analytics import inject_ga
 import streamlit as st
 
@@ -32,19 +36,17 @@ PEAS_SHEET = "Peas"
 SUNFLOWER_SHEET = "Sunflower"
 RANKER_VIZ = "images/ranking_process_visualized.png"
 LOGO_IMG = "images/logo.png"
-BLUP_SHEET = 'BLUP'
+# threads computing metric categories concurrently, worth raising for wide datasets
+RANK_WORKERS = int(os.environ.get('CULTIVAR_RANKER_WORKERS', 1))
 
-df, blup_df, catalog = pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+df, catalog = pd.DataFrame(), pd.DataFrame()
 for sheet in SHEET_IDS:
     _df, catalog = get_dfs_for_cultivar_ranker(sheet,
                                                CATALOG_SHEET,
                                                crop_sheets=[WHEAT_SHEET,
                                                             WHEAT_RELATIVES_SHEET,
                                                             PEAS_SHEET])
-    # todo: handle BLUP data better
-    _blup_df = load_csv_file(get_sheet_url(sheet, BLUP_SHEET))
     df = pd.concat([df, _df], ignore_index=True)
-    blup_df = pd.concat([blup_df, _blup_df], ignore_index=True)
 
 #################
 # STREAMLIT APP #
@@ -55,20 +57,15 @@ for sheet in SHEET_IDS:
 ###########
 with st.sidebar:
     st.markdown("**Select the parameters below**")
-    # todo: handle BLUP data better
-    df, blup_df = select_user_parameters(df, blup_df)
+    crop, location, season_id = select_user_parameters(df)
+    show_quality_report = st.checkbox('Show data-quality report')
     st.divider()
 
-crop = df.crop.unique()[0]
-if len(df['season'].dropna().unique()) > 1:
-    season = ', '.join(map(str, df['season'].dropna().unique()))
+selection_df = filter_selection(df, crop, location, season_id)
+if len(selection_df['season'].dropna().unique()) > 1:
+    season = ', '.join(map(str, selection_df['season'].dropna().unique()))
 else:
-    season = str(df['season'].dropna().unique()[0])
-
-# clean data to make it ready for analysis
-# todo: handle BLUP data better
-blup_df = remove_columns_with_all_nas(remove_listed_columns(blup_df, ['location', 'season']))
-df = clean_df_for_cr(df, catalog, blup_df)
+    season = str(selection_df['season'].dropna().unique()[0])
 
 # determine boundary metric
 boundary, boundary_string = get_boundary_metric(crop)
@@ -97,38 +94,15 @@ with st.expander("Show me how the ranking algorithm works."):
 # METRICS & RANK COMPUTATION #
 ##############################
 
-# create boundary metric
-boundary_df = df.copy()
-boundary_df = boundary_df[['cultivar', boundary]]
-
-
-# compute all ranks and metrics
-boundary_metrics, boundary_rank = analyze_and_rank(boundary_df, 'quality', catalog)
-qual_metrics, qual_rank = analyze_and_rank(df, 'quality', catalog)
-yield_metrics, yield_rank = analyze_and_rank(df, 'yield', catalog)
-disease_metrics, disease_rank = analyze_and_rank(df, 'diseases', catalog)
-agro_metrics, agro_rank = analyze_and_rank(df, 'agronomist', catalog)
-abio_metrics, abio_rank = analyze_and_rank(df, 'abiotic', catalog)
-weeds_metrics, weeds_rank = analyze_and_rank(df, 'weed_competition', catalog)
-morpho_metrics, morpho_rank = analyze_and_rank(df, 'morphological', catalog)
+# filter, clean and compute all ranks and metrics - cached per selection
+category_results, quality_report = cached_rank_selection(df, catalog, crop, location, season_id, RANK_WORKERS)
 
 ############################
 # OVERALL RANK COMPUTATION #
 ############################
-# create list with all rank dfs
-ranks = [boundary_rank[['cultivar', 'overall_rank-quality']]
-         .rename(columns={'overall_rank-quality': 'overall_rank-quality'.replace('quality', boundary)}),
-         yield_rank[['cultivar', 'overall_rank-yield']],
-         qual_rank[['cultivar', 'overall_rank-quality']],
-         disease_rank[['cultivar', 'overall_rank-diseases']],
-         agro_rank[['cultivar', 'overall_rank-agronomist']],
-         abio_rank[['cultivar', 'overall_rank-abiotic']],
-         weeds_rank[['cultivar', 'overall_rank-weed_competition']],
-         morpho_rank[['cultivar', 'overall_rank-morphological']]
-         ]
 weights = [BOUNDARY, YIELD, QUALITY, DISEASES, AGRONOMIST, ABIOTIC, WEEDS, MORPHOLOGICAL]
 
-df_rank = weighted_overall_rank(ranks, weights)
+df_rank = weighted_overall_rank(get_overall_ranks(category_results), weights)
 
 ###################
 # PRESENT RESULTS #
@@ -136,8 +110,7 @@ df_rank = weighted_overall_rank(ranks, weights)
 
 # OVERALL RANKINGS #
 st.markdown("## Overall Ranking")
-cmap = plt.cm.get_cmap('summer')  # spectral
-st.dataframe(df_rank.style.background_gradient(cmap=cmap, subset=['overall_rank']), hide_index=True)
+show_rank_table(df_rank, 'overall_rank', 'summer')  # spectral
 st.divider()
 
 # CONDITIONAL WHEAT CLASSES #
@@ -147,15 +120,20 @@ if crop == 'wheat':
     #st.divider()
     pass
 
-# BOUNDARY METRIC #
-boundary_rank.columns = [x.replace('quality', boundary) for x in boundary_rank.columns]
-visualize_metrics(boundary, boundary_metrics, boundary_rank, catalog, 1)
-
-# ALL OTHER METRICS METRIC #
-visualize_metrics('yield', yield_metrics, yield_rank, catalog, 2)
-visualize_metrics('quality', qual_metrics, qual_rank, catalog, 3)
-visualize_metrics('diseases', disease_metrics, disease_rank, catalog, 4)
-visualize_metrics('agronomist', agro_metrics, agro_rank, catalog, 5)
-visualize_metrics('abiotic', abio_metrics, abio_rank, catalog, 6)
-visualize_metrics('weed_competition', weeds_metrics, weeds_rank, catalog, 7)
-visualize_metrics('morphological', morpho_metrics, morpho_rank, catalog, 8)
+# BOUNDARY METRIC & ALL OTHER METRICS #
+for idx, (category, (category_metrics, category_rank)) in enumerate(category_results.items(), start=1):
+    visualize_metrics(category, category_metrics, category_rank, catalog, idx)
+
+# SIMILAR CULTIVARS #
+present_similar_cultivars(category_results, weights, len(category_results) + 1)
+
+# CROSS-SEASON TRENDS #
+if season_id == 'ALL':
+    present_cultivar_trends(df, catalog, crop, location, len(category_results) + 2)
+
+# DATA QUALITY #
+if show_quality_report:
+    present_quality_report(quality_report)
+
+# EXPORT #
+present_export_bundle(df, catalog, (crop, location, season_id), weights, RANK_WORKERS)
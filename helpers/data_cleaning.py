@@ -1,40 +1,96 @@
 import pandas as pd
-from .data_metrics import compute_duration_metrics
+from .data_metrics import compute_blup_df, compute_derived_metrics, get_blup_metrics
 from .utils import intersect_lists
 
 
+##################
+# QUALITY REPORT #
+##################
+# Cleaning steps optionally record what they drop or fail to coerce into @report, a list of frames with
+# REPORT_COLUMNS. Counts are computed from the same masks the steps use to filter, so no extra pass is needed.
+
+REPORT_COLUMNS = ['step', 'reason', 'column', 'cultivar', 'trial_id', 'count']
+
+
+def get_row_keys(data_frame, mask):
+    """Cultivar & trial of the rows in @mask; the cultivar column is still 'genotype' before renaming."""
+    keys = pd.DataFrame(index=data_frame.index[mask])
+    cultivar_col = 'cultivar' if 'cultivar' in data_frame.columns else 'genotype'
+    for key, col in [('cultivar', cultivar_col), ('trial_id', 'trial_id')]:
+        keys[key] = data_frame.loc[mask, col] if col in data_frame.columns else None
+    return keys
+
+
+def record_rows(report, step, reason, data_frame, mask, column=None):
+    """Records the rows in @mask (dropped or failed) per cultivar & trial."""
+    if report is None or not mask.any():
+        return
+    counts = get_row_keys(data_frame, mask).value_counts(dropna=False).rename('count').reset_index()
+    counts['step'], counts['reason'], counts['column'] = step, reason, column
+    report.append(counts[REPORT_COLUMNS])
+
+
+def record_columns(report, step, reason, columns, value_counts):
+    """Records dropped @columns, with the number of values lost in each."""
+    if report is None or len(columns) == 0:
+        return
+    report.append(pd.DataFrame({'step': step, 'reason': reason, 'column': columns, 'cultivar': None,
+                                'trial_id': None, 'count': [value_counts[x] for x in columns]})[REPORT_COLUMNS])
+
+
+def get_quality_report(report):
+    """Joins the recorded cleaning steps into one data frame."""
+    if report is None or len(report) == 0:
+        return pd.DataFrame(columns=REPORT_COLUMNS)
+    return pd.concat(report, ignore_index=True)
+
+
 ###########
 # FILTERS #
 ###########
 
 
-def remove_duplicates(data_frame):
-    return data_frame.drop_duplicates()
+def remove_duplicates(data_frame, report=None):
+    is_duplicate = data_frame.duplicated()
+    record_rows(report, 'filter', 'duplicate_row', data_frame, is_duplicate)
+    return data_frame[~is_duplicate]
 
 
-def remove_columns_with_all_nas(data_frame):
-    return data_frame.dropna(axis='columns', how='all')
+def remove_columns_with_all_nas(data_frame, report=None):
+    value_counts = data_frame.notna().sum()
+    record_columns(report, 'filter', 'all_na_column', list(value_counts.index[value_counts == 0]), value_counts)
+    return data_frame.loc[:, value_counts > 0]
 
 
-def remove_columns_with_nas_over_threshold(data_frame, threshold: float = 0.5):
-    return data_frame.dropna(axis='columns', thresh=round(threshold * len(data_frame)))
+def remove_columns_with_nas_over_threshold(data_frame, threshold: float = 0.5, report=None):
+    value_counts = data_frame.notna().sum()
+    keep = value_counts >= round(threshold * len(data_frame))
+    record_columns(report, 'filter', f'na_over_{threshold:g}_column', list(value_counts.index[~keep]), value_counts)
+    return data_frame.loc[:, keep]
 
 
 def remove_listed_columns(data_frame, lst_columns):
     return data_frame.drop(columns=intersect_lists(data_frame.columns, lst_columns))
 
 
-def remove_column_if_all_values_are_target_value(data_frame, cell_value: str):
-    return data_frame.T[~data_frame.eq(cell_value).all()].T
+def remove_column_if_all_values_are_target_value(data_frame, cell_value: str, report=None):
+    is_target = data_frame.eq(cell_value).all()
+    record_columns(report, 'filter', f'all_{cell_value}_column', list(is_target.index[is_target]),
+                   pd.Series(len(data_frame), index=is_target.index))
+    return data_frame.T[~is_target].T
 
 
-def remove_rows_if_all_na_in_specified_columns(data_frame, lst_columns):
-    return data_frame.dropna(axis='rows', subset=intersect_lists(data_frame.columns, lst_columns), how='all')
+def remove_rows_if_all_na_in_specified_columns(data_frame, lst_columns, report=None):
+    is_empty = data_frame[intersect_lists(data_frame.columns, lst_columns)].isna().all(axis='columns')
+    record_rows(report, 'filter', 'all_na_in_required_columns', data_frame, is_empty)
+    return data_frame[~is_empty]
 
 
-def remove_rows_if_val_in_col(data_frame, col, val):
+def remove_rows_if_val_in_col(data_frame, col, val, report=None):
     """Drop all rows that have @val as value in columns @col. Used for manual filtering of data."""
-    return data_frame.drop(data_frame[data_frame[col] == val].index)
+    is_val = data_frame[col] == val
+    record_rows(report, 'filter', f'{col}_is_{val}', data_frame, is_val, col)
+    return data_frame.drop(data_frame[is_val].index)
 
 
 def filter_data(data_frame,
@@ -43,18 +99,39 @@ def filter_data(data_frame,
                 cols_with_na_rows: list,
                 filter_col,
                 val_of_filer_col,
-                na_threshold=0.75):
-    data_frame = remove_rows_if_val_in_col(data_frame, filter_col, val_of_filer_col)
+                na_threshold=0.75,
+                report=None):
+    data_frame = remove_rows_if_val_in_col(data_frame, filter_col, val_of_filer_col, report)
     data_frame = remove_listed_columns(data_frame, columns_to_drop)
-    data_frame = remove_duplicates(data_frame)
-    data_frame = remove_columns_with_all_nas(data_frame)
-    data_frame = remove_columns_with_nas_over_threshold(data_frame, na_threshold)
-    data_frame = remove_column_if_all_values_are_target_value(data_frame, value_to_drop_col_if_only_value_in_column)
-    data_frame = remove_rows_if_all_na_in_specified_columns(data_frame, cols_with_na_rows)
+    data_frame = remove_duplicates(data_frame, report)
+    data_frame = remove_columns_with_all_nas(data_frame, report)
+    data_frame = remove_columns_with_nas_over_threshold(data_frame, na_threshold, report)
+    data_frame = remove_column_if_all_values_are_target_value(data_frame, value_to_drop_col_if_only_value_in_column,
+                                                              report)
+    data_frame = remove_rows_if_all_na_in_specified_columns(data_frame, cols_with_na_rows, report)
+
+    return data_frame
+
+
+def filter_selection(data_frame, crop, location, season):
+    """Filters data to the crop, location and season picked by the user ('ALL' keeps everything)."""
+    data_frame = data_frame[data_frame.crop == crop]
+
+    if location != 'ALL':
+        data_frame = data_frame[data_frame.location == location]
+
+    if season != 'ALL':
+        data_frame = data_frame[data_frame.season == season]
 
     return data_frame
 
 
+def get_selections(data_frame):
+    """Lists all (crop, location, season) selections found in the data."""
+    selections = data_frame[['crop', 'location', 'season']].dropna().drop_duplicates()
+    return list(selections.itertuples(index=False, name=None))
+
+
 ##################
 # VALUE RECODING #
 ##################
@@ -68,12 +145,16 @@ def coerce_float_columns(data_frame, lst_columns):
     data_frame[lst_columns] = data_frame[lst_columns].astype('float')
 
 
-def coerce_int_columns(data_frame, lst_columns):
+def coerce_int_columns(data_frame, lst_columns, report=None):
     for c in lst_columns:
+        values = pd.to_numeric(data_frame[c], errors='coerce')
+        record_rows(report, 'coerce', 'not_numeric', data_frame, values.isna() & data_frame[c].notna(), c)
         try:
-            data_frame[c] = pd.to_numeric(data_frame[c], errors='coerce').astype('Int64')
-        except Exception as e:
-            data_frame[c] = data_frame[c].astype('float')
+            data_frame[c] = values.astype('Int64')
+        except (TypeError, ValueError):
+            # non-integer values, e.g. 2.5: keep the column as float
+            record_rows(report, 'coerce', 'not_integer_kept_as_float', data_frame, values.notna() & (values % 1 != 0), c)
+            data_frame[c] = values.astype('float')
 
 
 def coerce_date_columns(data_frame, lst_columns, date_format='%B %d, %Y'):
@@ -81,14 +162,14 @@ def coerce_date_columns(data_frame, lst_columns, date_format='%B %d, %Y'):
         data_frame[col] = pd.to_datetime(data_frame[col], format=date_format)
 
 
-def coerce_dtypes(data_frame, catalog_df):
+def coerce_dtypes(data_frame, catalog_df, report=None):
     float_cols = intersect_lists(data_frame.columns, list(catalog_df[catalog_df['data_type'] == "float"].metric))
     int_cols = intersect_lists(data_frame.columns,
                                list(catalog_df[catalog_df['data_type'].isin(['integer', 'category'])].metric))
     date_cols = intersect_lists(data_frame.columns, list(catalog_df[catalog_df.data_type == "date"].metric))
 
     coerce_float_columns(data_frame, float_cols)
-    coerce_int_columns(data_frame, int_cols)
+    coerce_int_columns(data_frame, int_cols, report)
     coerce_date_columns(data_frame, date_cols)
 
     return data_frame
@@ -101,7 +182,7 @@ def coerce_dtypes(data_frame, catalog_df):
 def aggregate_object_cols(data_frame, group_by_cols=None):
     if group_by_cols is None:
         group_by_cols = ['trial_id', 'cultivar']
-    _df = data_frame.copy().select_dtypes(include='object')
+    _df = data_frame.select_dtypes(include='object')
 
     # Trim whitespace from all object columns
     _df = _df.applymap(lambda x: x.strip() if isinstance(x, str) else x)
@@ -118,7 +199,7 @@ def filter_df_numeric_columns(data_frame, keep_cols):
     else:
         keep_cols = [x for x in keep_cols]
 
-    types = data_frame.copy().dtypes.reset_index()
+    types = data_frame.dtypes.reset_index()
     types.columns = ['metric', 'dtype']
     types = types[types.dtype != 'object']
 
@@ -151,7 +232,12 @@ def aggregate_data(data_frame, group_by_cols=None):
 # ALL CLEANING PROCEDURES #
 ###########################
 
-def clean_df_for_cr(data_frame, catalog_df, blup_df=None):
+def clean_df_for_cr(data_frame, catalog_df, report=None):
+    """
+    Filters, coerces, derives and aggregates raw trial rows into one row per cultivar.
+    Metrics flagged in the catalog's 'blup' column are replaced by their BLUP-adjusted means.
+    Pass a list as @report to collect what was dropped and why (see get_quality_report).
+    """
     # set params - anti-pattern within funct, but easier
     cols_to_drop = ['qr_code_seed', 'qr_code_plant_material', 'crop', 'season', 'location', 'plot_id',
                     'experiment_type', 'exclude_from_analysis']
@@ -162,19 +248,24 @@ def clean_df_for_cr(data_frame, catalog_df, blup_df=None):
     filter_val = True
 
     # clean data frame
-    data_frame = filter_data(data_frame, cols_to_drop, row_vals_to_drop_col, cols_with_na_rows, filter_col, filter_val)
+    data_frame = filter_data(data_frame, cols_to_drop, row_vals_to_drop_col, cols_with_na_rows, filter_col, filter_val,
+                             report=report)
     data_frame = rename_columns(data_frame, {'genotype': 'cultivar'})
-    data_frame = coerce_dtypes(data_frame, catalog_df)
+    data_frame = coerce_dtypes(data_frame, catalog_df, report)
 
-    # get derived duration metrics and drop date columns
+    # get derived metrics (durations, ratios, indices) and drop date columns
     date_cols = list(catalog_df[catalog_df['data_type'] == 'date'].metric)
-    data_frame = compute_duration_metrics(data_frame)
+    failed = []
+    data_frame = compute_derived_metrics(data_frame, catalog_df, failed)
+    for metric, error in failed:
+        record_columns(report, 'derive', f'invalid_expression: {error}', [metric], {metric: len(data_frame)})
     data_frame = remove_listed_columns(data_frame, date_cols)
 
     # aggregate data - aggregated per cultivar & trial_id, needed for blup join
     data_frame = aggregate_data(data_frame, ['trial_id', 'cultivar'])
 
-    # correct blup metrics if they exist
+    # correct blup metrics if they exist - computed from the per cultivar & trial_id data
+    blup_df = compute_blup_df(data_frame, get_blup_metrics(catalog_df))
     if len(blup_df) > 0:
         merged_df = pd.merge(data_frame,
                              blup_df,
@@ -195,7 +286,7 @@ def clean_df_for_cr(data_frame, catalog_df, blup_df=None):
     # remove artefacts needed for blup overriding
     data_frame = data_frame.drop(columns=['trial_id', 'crop'], errors='ignore')
 
-    # reaggregate - if blup_df was on a different granularity
+    # reaggregate - one row per cultivar
     data_frame = aggregate_data(data_frame, ['cultivar'])
 
     return data_frame
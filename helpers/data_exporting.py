@@ -0,0 +1,164 @@
+import json
+import os
+import re
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from .data_ranking import get_overall_ranks, weighted_overall_rank
+
+# export format: (file extension, mime type)
+EXPORT_FORMATS = {'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+                  'parquet': ('zip', 'application/zip'),
+                  'json': ('json', 'application/json')}
+CHUNK_SIZE = 5000
+# table exported instead of the results of a selection that failed to rank
+ERROR_TABLE = 'error'
+
+# a single background worker is enough: exports are queued instead of competing with the app for CPU
+_export_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='export')
+
+
+def selection_name(selection):
+    """Human-readable name for a (crop, location, season) selection."""
+    return '-'.join(str(x) for x in selection)
+
+
+def selection_file_name(selection):
+    """selection_name usable as a file or archive member name: seasons like '2020/2021' must not create folders."""
+    return re.sub(r'[^\w.-]+', '_', selection_name(selection))
+
+
+def iter_export_tables(df_rank, category_results):
+    """Yields (table name, data frame) pairs for the overall rank and every category's metrics and ranks."""
+    yield 'overall_rank', df_rank
+    for category, (df_metrics, df_category_rank) in category_results.items():
+        yield f'{category}-metrics', df_metrics
+        yield f'{category}-rank', df_category_rank
+
+
+def iter_export_bundle(selections, rank_fn, weights):
+    """
+    Yields (selection, table name, data frame) for every selection. Selections are ranked lazily with @rank_fn
+    (a (crop, location, season) -> category results callable, usually the cached one), so only one selection's
+    results are held in memory at a time. A selection that fails to rank doesn't abort the export: it gets a
+    single ERROR_TABLE table with the error instead.
+    """
+    for selection in selections:
+        try:
+            category_results = rank_fn(*selection)
+            df_rank = weighted_overall_rank(get_overall_ranks(category_results), weights)
+        except Exception as e:
+            yield selection, ERROR_TABLE, pd.DataFrame({'error': [f'{type(e).__name__}: {e}']})
+            continue
+        for table_name, table in iter_export_tables(df_rank, category_results):
+            yield selection, table_name, table
+
+
+def iter_chunks(data_frame, chunk_size=CHUNK_SIZE):
+    for start in range(0, len(data_frame), chunk_size):
+        yield data_frame.iloc[start:start + chunk_size]
+
+
+###########
+# WRITERS #
+###########
+
+def write_json(bundle, file_obj, chunk_size=CHUNK_SIZE):
+    """Streams the bundle as {selection: {table: [records]}}, one chunk of records at a time."""
+    file_obj.write('{')
+    last_selection = None
+    for selection, table_name, table in bundle:
+        if selection != last_selection:
+            if last_selection is not None:
+                file_obj.write('},')
+            file_obj.write(f'{json.dumps(selection_name(selection))}:{{')
+            last_selection = selection
+        else:
+            file_obj.write(',')
+        file_obj.write(f'{json.dumps(table_name)}:[')
+        for idx, chunk in enumerate(iter_chunks(table, chunk_size)):
+            if idx > 0:
+                file_obj.write(',')
+            file_obj.write(chunk.to_json(orient='records')[1:-1])
+        file_obj.write(']')
+    if last_selection is not None:
+        file_obj.write('}')
+    file_obj.write('}')
+
+
+def write_xlsx(bundle, file_obj, chunk_size=CHUNK_SIZE):
+    """Streams the bundle into a write-only workbook: an index sheet plus one sheet per selection and table."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    index_sheet = workbook.create_sheet('index')
+    index_sheet.append(['sheet', 'crop', 'location', 'season', 'table'])
+
+    selection_ids = {}
+    for selection, table_name, table in bundle:
+        selection_id = selection_ids.setdefault(selection, len(selection_ids) + 1)
+        # excel limits sheet names to 31 characters
+        sheet_name = f'{selection_id}_{table_name}'[:31]
+        index_sheet.append([sheet_name, *[str(x) for x in selection], table_name])
+
+        sheet = workbook.create_sheet(sheet_name)
+        sheet.append(list(table.columns))
+        for chunk in iter_chunks(table, chunk_size):
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+            for row in chunk.itertuples(index=False, name=None):
+                sheet.append(list(row))
+
+    workbook.save(file_obj)
+
+
+def write_parquet(bundle, file_obj, chunk_size=CHUNK_SIZE):
+    """Streams the bundle into a zip archive holding one parquet file per selection and table."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    with zipfile.ZipFile(file_obj, 'w') as archive:
+        for selection, table_name, table in bundle:
+            with archive.open(f'{selection_file_name(selection)}/{table_name}.parquet', 'w', force_zip64=True) as stream:
+                schema = pa.Schema.from_pandas(table, preserve_index=False)
+                with pq.ParquetWriter(stream, schema) as writer:
+                    for chunk in iter_chunks(table, chunk_size):
+                        writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+WRITERS = {'xlsx': (write_xlsx, 'wb'),
+           'parquet': (write_parquet, 'wb'),
+           'json': (write_json, 'w')}
+
+
+def export_bundle(selections, rank_fn, weights, export_format, chunk_size=CHUNK_SIZE):
+    """Writes the export bundle for @selections to a temporary file and returns its path."""
+    writer, mode = WRITERS[export_format]
+    extension, _ = EXPORT_FORMATS[export_format]
+    fd, path = tempfile.mkstemp(prefix='cultivar_ranker_', suffix=f'.{extension}')
+    try:
+        with os.fdopen(fd, mode) as file_obj:
+            writer(iter_export_bundle(selections, rank_fn, weights), file_obj, chunk_size)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def start_export(selections, rank_fn, weights, export_format, chunk_size=CHUNK_SIZE):
+    """Runs export_bundle on the background worker. Returns a Future resolving to the exported file path."""
+    if export_format not in WRITERS:
+        raise ValueError(f"Unknown export format '{export_format}', pick one of {list(WRITERS)}.")
+    return _export_executor.submit(export_bundle, list(selections), rank_fn, list(weights), export_format, chunk_size)
+
+
+def discard_export(job):
+    """Deletes the file written by an export job, once the job is finished."""
+    def remove_file(future):
+        if future.exception() is None and os.path.exists(future.result()):
+            os.remove(future.result())
+
+    job.add_done_callback(remove_file)
+
@@ -1,10 +1,16 @@
+import os
 import pandas as pd
 from .utils import camel_case_string
 from .data_cleaning import remove_listed_columns
 
+# when set, sheets are read from local CSVs <dir>/<sheet_id>/<sheet_name>.csv instead of Google Sheets
+LOCAL_DATA_DIR_ENV = 'CULTIVAR_RANKER_DATA_DIR'
+
 
 def get_sheet_url(sheet_id, sheet_name):
-    """Return sanitized url to access Google Sheets Sheet."""
+    """Return sanitized url to access Google Sheets Sheet (or the local CSV path if LOCAL_DATA_DIR_ENV is set)."""
+    if os.environ.get(LOCAL_DATA_DIR_ENV):
+        return os.path.join(os.environ[LOCAL_DATA_DIR_ENV], sheet_id, f'{sheet_name}.csv')
     sheet_name = sheet_name.replace(' ', '%20')
     url = f'https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq?tqx=out:csv&sheet={sheet_name}'
     return url
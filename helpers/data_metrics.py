@@ -1,6 +1,10 @@
+import ast
+from functools import lru_cache
 from .utils import title_case_string
 import numpy as np
 import pandas as pd
+from scipy import sparse
+from scipy.sparse import linalg as sparse_linalg
 
 
 def get_boundary_metric(crop_name):
@@ -17,27 +21,106 @@ def get_boundary_metric(crop_name):
     return boundary, boundary_string
 
 
-def derive_duration_column(data_frame, new_col_name, start_date_col, end_date_col):
-    """Computes the duration in days between @start_date_col and @end_date_col and saves it under @new_col_name."""
-    data_frame[new_col_name] = (data_frame[end_date_col] - data_frame[start_date_col]) / np.timedelta64(1, 'D')
-    return data_frame
+###################
+# DERIVED METRICS #
+###################
+# Derived metrics are declared in the catalog: rows with an 'expression' column, e.g.
+# 'date_of_heading - date_of_emergence' or 'grain_yield / plant_height'. Expressions may use +, -, *, /, **,
+# comparisons, numbers, other metrics and DERIVED_METRIC_FUNCTIONS. Date differences are converted to days.
 
+# computed also when the catalog does not define them; catalog expressions take precedence
+DEFAULT_DERIVED_METRICS = {
+    'days_between_emergence_and_heading': 'date_of_heading - date_of_emergence',
+    'days_between_emergence_and_flowering': 'date_of_flowering - date_of_emergence',
+}
 
-def compute_duration_metrics(data_frame):
-    if 'date_of_emergence' in data_frame.columns:
-        if 'date_of_heading' in data_frame.columns:
-            data_frame = derive_duration_column(data_frame,
-                                                'days_between_emergence_and_heading',
-                                                'date_of_emergence',
-                                                'date_of_heading'
-                                                )
-        if 'date_of_flowering' in data_frame.columns:
-            data_frame = derive_duration_column(data_frame,
-                                                'days_between_emergence_and_flowering',
-                                                'date_of_emergence',
-                                                'date_of_flowering'
-                                                )
-    return data_frame
+DERIVED_METRIC_FUNCTIONS = {
+    'abs': np.abs,
+    'sqrt': np.sqrt,
+    'log': np.log,
+    'exp': np.exp,
+    'min': np.fmin,
+    'max': np.fmax,
+    'where': np.where,
+}
+
+ALLOWED_EXPRESSION_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call, ast.Name, ast.Load,
+                            ast.Constant, ast.operator, ast.unaryop, ast.cmpop)
+
+
+@lru_cache(maxsize=None)
+def compile_expression(expression):
+    """Validates and compiles a derived metric expression. Returns the code object and its input metrics."""
+    tree = ast.parse(str(expression).strip(), mode='eval')
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_EXPRESSION_NODES):
+            raise ValueError(f"Unsupported syntax '{type(node).__name__}' in derived metric '{expression}'.")
+        if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name)
+                                               and node.func.id in DERIVED_METRIC_FUNCTIONS):
+            raise ValueError(f"Unsupported function in derived metric '{expression}'.")
+
+    inputs = tuple(dict.fromkeys(node.id for node in ast.walk(tree)
+                                 if isinstance(node, ast.Name) and node.id not in DERIVED_METRIC_FUNCTIONS))
+
+    return compile(tree, f'<derived metric: {expression}>', 'eval'), inputs
+
+
+def get_derived_metric_definitions(catalog_df):
+    """Returns {metric: (expression, data_type)} for the default and the catalog-defined derived metrics."""
+    definitions = {metric: (expression, 'float') for metric, expression in DEFAULT_DERIVED_METRICS.items()}
+    if 'expression' in catalog_df.columns:
+        derived = catalog_df[catalog_df['expression'].notna()]
+        for metric, expression, data_type in zip(derived.metric, derived.expression, derived.data_type):
+            definitions[metric] = (expression, data_type)
+
+    return definitions
+
+
+def column_values(column):
+    """Numpy values of a column for expression evaluation: dates as datetime64, everything else as float."""
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return column.to_numpy()
+    return pd.to_numeric(column, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+
+
+def compute_derived_metrics(data_frame, catalog_df, failed=None):
+    """
+    Evaluates all derived metrics as vectorized expressions over the columns of @data_frame, in one pass.
+    Derived metrics can build on each other (in definition order); metrics with missing inputs are skipped.
+    Malformed or unsupported expressions are skipped too, and appended to @failed as (metric, error) if given.
+    """
+    namespace = dict(DERIVED_METRIC_FUNCTIONS)
+    derived = {}
+    for metric, (expression, data_type) in get_derived_metric_definitions(catalog_df).items():
+        try:
+            code, inputs = compile_expression(expression)
+            if not all(x in data_frame.columns or x in derived for x in inputs):
+                continue
+            for x in inputs:
+                if x not in namespace:
+                    namespace[x] = column_values(data_frame[x])
+
+            with np.errstate(invalid='ignore', divide='ignore'):
+                values = np.broadcast_to(eval(code, {'__builtins__': {}}, namespace), len(data_frame))
+            if np.issubdtype(values.dtype, np.timedelta64):
+                values = values / np.timedelta64(1, 'D')
+
+            # divisions by zero give +-inf, which would skew means and ranks: treat them as missing
+            values = pd.Series(values, index=data_frame.index, dtype=float).replace([np.inf, -np.inf], np.nan)
+            if data_type in ['integer', 'category']:
+                values = values.round().astype('Int64')
+        except (SyntaxError, TypeError, ValueError, ZeroDivisionError, OverflowError) as e:
+            if failed is not None:
+                failed.append((metric, e))
+            continue
+        derived[metric] = values
+        namespace[metric] = column_values(values)
+
+    if len(derived) == 0:
+        return data_frame
+
+    return pd.concat([data_frame.drop(columns=list(derived), errors='ignore'), pd.DataFrame(derived)],
+                     axis='columns')
 
 
 def overwrite_columns(df1, df2, key):
@@ -71,6 +154,92 @@ def compute_blup_metrics(data_frame, blup_df, catalog_df, key='cultivar'):
     return data_frame
 
 
+########
+# BLUP #
+########
+# Metrics flagged in the catalog's 'blup' column are corrected with BLUPs computed from the trial-level data:
+# y = trial (fixed, i.e. location x season) + cultivar (random) + error, solved with Henderson's mixed model
+# equations on sparse matrices. The variance ratio comes from a fixed-effects fit of the same design.
+
+def get_blup_metrics(catalog_df):
+    if 'blup' not in catalog_df.columns:
+        return []
+    is_blup = catalog_df['blup'].astype(str).str.strip().str.lower().isin(['true', '1', 'yes'])
+    return list(catalog_df[is_blup].metric)
+
+
+def one_hot(codes, n_levels):
+    return sparse.csr_matrix((np.ones(len(codes)), (np.arange(len(codes)), codes)), shape=(len(codes), n_levels))
+
+
+def estimate_variance_ratio(y, X, Z):
+    """
+    Residual to cultivar variance ratio (lambda) from a fixed-effects fit y ~ trial + cultivar: the residual variance
+    from the fit, the cultivar variance from the spread of the cultivar effects net of their sampling variance.
+    Returns None when the design leaves no degrees of freedom for the residuals, or when the fit leaves (almost) no
+    residual variance: lambda would be ~0 and the mixed model equations singular.
+    """
+    n, p, q = len(y), X.shape[1], Z.shape[1]
+    residual_df = n - p - q + 1
+    if residual_df <= 0:
+        return None
+
+    # first cultivar is the reference level
+    design = sparse.hstack([X, Z[:, 1:]]).tocsr()
+    effects = sparse_linalg.lsqr(design, y, atol=1e-10, btol=1e-10)[0]
+    residual_var = np.sum((y - design @ effects) ** 2) / residual_df
+    if not residual_var > 1e-10 * np.var(y):
+        return None
+
+    cultivar_effects = np.concatenate([[0], effects[p:]])
+    cultivar_counts = np.asarray(Z.sum(axis=0)).ravel()
+    cultivar_var = np.var(cultivar_effects, ddof=1) - np.mean(residual_var / cultivar_counts)
+    # no detectable cultivar variance: shrink (almost) fully to the mean
+    cultivar_var = max(cultivar_var, 1e-6 * residual_var)
+
+    return residual_var / cultivar_var
+
+
+def compute_cultivar_blups(data_frame, metric, trial_col='trial_id', key='cultivar'):
+    """
+    BLUP-adjusted means of @metric per cultivar: the average trial effect plus the cultivar's BLUP.
+    @data_frame holds one row per trial & cultivar. Returns None if the data cannot support the model.
+    """
+    obs = data_frame[[trial_col, key, metric]].dropna()
+    trials, trial_codes = np.unique(obs[trial_col].to_numpy(), return_inverse=True)
+    cultivars, cultivar_codes = np.unique(obs[key].to_numpy(), return_inverse=True)
+    if len(cultivars) < 2:
+        return None
+
+    y = obs[metric].to_numpy(dtype=float)
+    X, Z = one_hot(trial_codes, len(trials)), one_hot(cultivar_codes, len(cultivars))
+    variance_ratio = estimate_variance_ratio(y, X, Z)
+    if variance_ratio is None:
+        return None
+
+    # Henderson's mixed model equations: [X'X X'Z; Z'X Z'Z + lambda I] [b; u] = [X'y; Z'y]
+    lhs = sparse.bmat([[X.T @ X, X.T @ Z],
+                       [Z.T @ X, Z.T @ Z + variance_ratio * sparse.identity(len(cultivars))]]).tocsc()
+    rhs = np.concatenate([X.T @ y, Z.T @ y])
+    solution = sparse_linalg.spsolve(lhs, rhs)
+    trial_effects, cultivar_blups = solution[:len(trials)], solution[len(trials):]
+
+    return pd.Series(trial_effects.mean() + cultivar_blups, index=cultivars, name=metric)
+
+
+def compute_blup_df(data_frame, metrics, trial_col='trial_id', key='cultivar'):
+    """Computes BLUP-adjusted means for @metrics, repeated for every trial & cultivar row of @data_frame."""
+    blup_df = data_frame[[trial_col, key]].copy()
+    for metric in metrics:
+        if metric not in data_frame.columns:
+            continue
+        blups = compute_cultivar_blups(data_frame, metric, trial_col, key)
+        if blups is not None:
+            blup_df[metric] = blup_df[key].map(blups).round(2)
+
+    return blup_df if len(blup_df.columns) > 2 else blup_df.iloc[:0]
+
+
 def get_wheat_classes(moisture, protein, mass, impurities):
     wheat_class_definition = [
         # in order: max moisture, min protein, min mass, max impurities
@@ -94,11 +263,9 @@ def get_metrics(data_frame, metric_type, metrics_catalog_df, keep_cols=None):
     if keep_cols is None:
         keep_cols = ['cultivar']
 
-    _df = data_frame.copy()
-
     # preselect just existing catalog
     cols_subset = keep_cols + list(metrics_catalog_df[metrics_catalog_df.type == metric_type].metric)
-    cols_subset_clean = [x for x in cols_subset if x in _df.columns]
-    df_metrics = _df[cols_subset_clean]
+    cols_subset_clean = [x for x in cols_subset if x in data_frame.columns]
+    df_metrics = data_frame[cols_subset_clean]
 
     return df_metrics
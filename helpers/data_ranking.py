@@ -1,28 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import numpy as np
 import pandas as pd
 
-from .data_metrics import get_metrics
+from .data_cleaning import clean_df_for_cr, filter_selection
+from .data_metrics import get_boundary_metric, get_metrics
+
+# metric categories ranked next to the boundary metric, in the order of the ranking sliders
+CATEGORIES = ['yield', 'quality', 'diseases', 'agronomist', 'abiotic', 'weed_competition', 'morphological']
 
 
 def rank_metrics(df, metrics_catalog_df, keep_cols=None):
     """Simple ranking algorithm, column-wise."""
     if keep_cols is None:
         keep_cols = ['cultivar']
-    _df = df.copy()
-
-    # create the bases for ranking
-    df = _df.copy()[keep_cols]
-
-    # iterate through columns and rank
-    for col in _df.columns:
+    # rank every rankable column, then add the ranks to the keep_cols in one go
+    ranks = {}
+    for col in df.columns:
         if col not in keep_cols:
             is_ascending = list(metrics_catalog_df[metrics_catalog_df.metric == col]['rank_ascending'])[0]
             if is_ascending is not np.nan:  # prevents ranking of non-rankable catalog
-                df['rank-' + col] = _df[col].rank(ascending=is_ascending,
-                                                  method="dense",
-                                                  na_option='bottom').astype(int)
+                ranks['rank-' + col] = df[col].rank(ascending=is_ascending,
+                                                    method="dense",
+                                                    na_option='bottom').astype(int)
 
-    return df
+    return pd.concat([df[keep_cols], pd.DataFrame(ranks, index=df.index)], axis='columns')
 
 
 def weighted_rank(df_rank, metric_type, weights=None):
@@ -83,11 +85,52 @@ def analyze_and_rank(df, metric_type, metrics_catalog_df, weights=None, keep_col
     """Joins multiple analysis and ranking operations together."""
     if keep_cols is None:
         keep_cols = ['cultivar']
-    _df = df.copy()
-
-    df_metrics = get_metrics(_df, metric_type, metrics_catalog_df, keep_cols)
+    df_metrics = get_metrics(df, metric_type, metrics_catalog_df, keep_cols)
     df_rank_simple = rank_metrics(df_metrics, metrics_catalog_df, keep_cols)
     df_rank = weighted_rank(df_rank_simple, metric_type, weights)
 
     return df_metrics, df_rank
 
+
+def analyze_and_rank_categories(df, metrics_catalog_df, boundary, workers=1):
+    """
+    Runs analyze_and_rank for the boundary metric and every metric category.
+    Returns a dict {category: (df_metrics, df_rank)}, with the boundary metric first.
+
+    Categories are independent and only read @df and @metrics_catalog_df, so with @workers > 1 they are computed
+    concurrently in a thread pool sharing the same frames. The output is identical for any number of workers.
+    """
+    def analyze_boundary():
+        boundary_metrics, boundary_rank = analyze_and_rank(df[['cultivar', boundary]], 'quality', metrics_catalog_df)
+        boundary_rank.columns = [x.replace('quality', boundary) for x in boundary_rank.columns]
+        return boundary_metrics, boundary_rank
+
+    tasks = {boundary: analyze_boundary}
+    for category in CATEGORIES:
+        tasks[category] = partial(analyze_and_rank, df, category, metrics_catalog_df)
+
+    if workers <= 1:
+        return {category: task() for category, task in tasks.items()}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {category: executor.submit(task) for category, task in tasks.items()}
+        return {category: future.result() for category, future in futures.items()}
+
+
+def get_overall_ranks(category_results):
+    """Collects the overall rank column of every category, ready for weighted_overall_rank."""
+    return [df_rank[['cultivar', f'overall_rank-{category}']] for category, (_, df_rank) in category_results.items()]
+
+
+def rank_selection(data_frame, metrics_catalog_df, crop, location, season, report=None, workers=1):
+    """
+    Filters, cleans and ranks the data for one (crop, location, season) selection.
+    Pass a list as @report to collect the data-quality report of the cleaning.
+    @workers is the number of threads computing categories concurrently.
+    """
+    data_frame = filter_selection(data_frame, crop, location, season)
+    data_frame = clean_df_for_cr(data_frame, metrics_catalog_df, report)
+
+    boundary, _ = get_boundary_metric(crop)
+
+    return analyze_and_rank_categories(data_frame, metrics_catalog_df, boundary, workers)
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+
+def get_feature_weights(category_results, category_weights=None):
+    """
+    Maps category weights (same as the ranking sliders) to per-metric weights. Each category's weight is spread
+    equally over its rankable metrics, the same way weighted_rank averages them. Without weights, or if all are 0,
+    every metric counts equally.
+    """
+    use_weights = category_weights is not None and sum(category_weights.values()) > 0
+
+    feature_weights = {}
+    for category, (_, df_rank) in category_results.items():
+        metrics = [x.replace('rank-', '', 1) for x in df_rank.columns if x.startswith('rank-')]
+        for metric in metrics:
+            if use_weights:
+                feature_weights[metric] = feature_weights.get(metric, 0) + category_weights.get(category, 0) / len(metrics)
+            else:
+                feature_weights[metric] = 1
+
+    return pd.Series(feature_weights, dtype=float)
+
+
+def build_similarity_index(category_results, category_weights=None):
+    """
+    Precomputes everything similarity queries need from the cleaned cultivar x metric values: metrics are
+    standardized (z-scores, ignoring NaNs) and missing values are tracked in a mask, so that distances are computed
+    only over the metrics both cultivars have.
+    """
+    metric_dfs = [df_metrics.set_index('cultivar') for df_metrics, _ in category_results.values()]
+    metrics_df = pd.concat(metric_dfs, axis='columns')
+    metrics_df = metrics_df.loc[:, ~metrics_df.columns.duplicated()]
+
+    feature_weights = get_feature_weights(category_results, category_weights)
+    features = [x for x in feature_weights.index if x in metrics_df.columns and feature_weights[x] > 0]
+
+    values = metrics_df[features].to_numpy(dtype=float, na_value=np.nan)
+    observed = ~np.isnan(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.nanstd(values, axis=0)
+        z = (values - np.nanmean(values, axis=0)) / np.where(std > 0, std, 1)
+    z = np.where(observed, z, 0)
+
+    return {'cultivars': metrics_df.index.to_numpy(),
+            'features': features,
+            'weights': feature_weights[features].to_numpy(),
+            'observed': observed.astype(float),
+            'z': z,
+            'z_squared': z ** 2}
+
+
+def compute_distances(index, query_z, query_observed):
+    """
+    Weighted euclidean distances from one standardized query row to all cultivars, over shared metrics only,
+    normalized by the weight of the shared metrics. Expands (q - x)^2 into three matrix-vector products.
+    """
+    w = index['weights'] * query_observed
+    shared_weight = index['observed'] @ w
+    squared = (index['observed'] @ (w * query_z ** 2)
+               - 2 * index['z'] @ (w * query_z)
+               + index['z_squared'] @ w)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        distances = np.sqrt(np.clip(squared, 0, None) / shared_weight)
+
+    return distances, index['observed'] @ query_observed
+
+
+def find_similar_cultivars(index, cultivar, k=5):
+    """Returns the @k cultivars closest to @cultivar in the metric space, nearest first."""
+    positions = np.flatnonzero(index['cultivars'] == cultivar)
+    if len(positions) == 0:
+        raise ValueError(f"Unknown cultivar '{cultivar}'.")
+    position = positions[0]
+
+    distances, shared_metrics = compute_distances(index, index['z'][position], index['observed'][position])
+    distances[position] = np.nan
+    distances = np.where(shared_metrics > 0, distances, np.nan)
+
+    # argpartition keeps top-k selection linear in the number of cultivars
+    k = min(k, int((~np.isnan(distances)).sum()))
+    candidates = np.where(np.isnan(distances), np.inf, distances)
+    nearest = np.argpartition(candidates, k - 1)[:k] if k > 0 else np.array([], dtype=int)
+    nearest = nearest[np.argsort(candidates[nearest], kind='stable')]
+
+    return pd.DataFrame({'cultivar': index['cultivars'][nearest],
+                         'distance': distances[nearest].round(3),
+                         'similarity': (1 / (1 + distances[nearest])).round(3),
+                         'shared_metrics': shared_metrics[nearest].astype(int)})
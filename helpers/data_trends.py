@@ -0,0 +1,199 @@
+import numpy as np
+import pandas as pd
+
+from .data_cleaning import remove_rows_if_val_in_col, rename_columns
+from .data_metrics import compute_derived_metrics
+from .utils import intersect_lists
+
+# the granularity of the trend store
+STORE_KEYS = ['crop', 'cultivar', 'season', 'location']
+STATS = ['count', 'sum', 'sumsq']
+
+
+###############
+# TREND STORE #
+###############
+# The trend store keeps sufficient statistics (count, sum, sum of squares) per metric and
+# (crop, cultivar, season, location), in columns named like 'sum-grain_yield'. Means and variances
+# at any coarser granularity can be derived from it without going back to the raw trial rows.
+
+
+def coerce_trend_columns(data_frame, catalog_df, date_format='%B %d, %Y'):
+    """
+    Like coerce_dtypes, but values that cannot be parsed (e.g. 'canceled') become NaN instead of raising:
+    the store takes rows of all crops, without the per-selection filters of the ranking.
+    """
+    numeric_cols = intersect_lists(data_frame.columns,
+                                   list(catalog_df[catalog_df['data_type'].isin(['float', 'integer', 'category'])].metric))
+    date_cols = intersect_lists(data_frame.columns, list(catalog_df[catalog_df.data_type == "date"].metric))
+
+    data_frame[numeric_cols] = data_frame[numeric_cols].apply(pd.to_numeric, errors='coerce')
+    for col in date_cols:
+        data_frame[col] = pd.to_datetime(data_frame[col], format=date_format, errors='coerce')
+
+    return data_frame
+
+
+def prepare_trend_rows(data_frame, catalog_df):
+    """Cleans raw trial rows just enough to collect statistics: keys + numeric metrics."""
+    data_frame = remove_rows_if_val_in_col(data_frame, 'exclude_from_analysis', True)
+    data_frame = rename_columns(data_frame, {'genotype': 'cultivar'}).dropna(subset=STORE_KEYS)
+
+    # keys are kept as loaded, so new rows match the keys already in the store
+    metrics_df = coerce_trend_columns(data_frame.drop(columns=STORE_KEYS), catalog_df)
+    metrics_df = compute_derived_metrics(metrics_df, catalog_df)
+    metrics_df = metrics_df.select_dtypes(include='number').astype('float')
+
+    return pd.concat([data_frame[STORE_KEYS], metrics_df], axis='columns')
+
+
+def compute_sufficient_statistics(rows):
+    """Collects count, sum and sum of squares of every metric in @rows, per STORE_KEYS."""
+    metrics = [x for x in rows.columns if x not in STORE_KEYS]
+    values = rows[metrics]
+    stats = pd.concat([values.notna(), values.fillna(0), values.pow(2).fillna(0)],
+                      axis='columns',
+                      keys=STATS)
+    stats.columns = [f'{stat}-{metric}' for stat, metric in stats.columns]
+    stats[STORE_KEYS] = rows[STORE_KEYS]
+
+    return stats.groupby(STORE_KEYS).sum()
+
+
+def merge_statistics(store, new_stats):
+    """Adds @new_stats to @store; keys present in both are summed, metrics missing in either count as empty."""
+    if store is None or len(store) == 0:
+        return new_stats
+    return pd.concat([store, new_stats]).groupby(level=STORE_KEYS).sum()
+
+
+def append_to_trend_store(store, new_rows, catalog_df):
+    """Merges new raw trial rows into the store without touching the rows already aggregated."""
+    new_stats = compute_sufficient_statistics(prepare_trend_rows(new_rows, catalog_df))
+    return merge_statistics(store, new_stats)
+
+
+def get_season_hashes(data_frame):
+    """
+    Content hash of the raw rows of every (crop, season) of @data_frame. Columns are hashed as they are
+    (no conversion to strings), which keeps this cheap enough to run on every rerun.
+    """
+    row_hashes = pd.util.hash_pandas_object(data_frame, index=False)
+    season_hashes = row_hashes.groupby([data_frame['crop'], data_frame['season']])
+    return season_hashes.agg(lambda x: hash(x.to_numpy().tobytes())).to_dict()
+
+
+def is_in_seasons(crops, seasons, crop_seasons):
+    if len(crop_seasons) == 0:
+        return np.zeros(len(crops), dtype=bool)
+    return pd.MultiIndex.from_arrays([crops, seasons]).isin(crop_seasons)
+
+
+def update_trend_store(store, data_frame, catalog_df, known_hashes=None, season_hashes=None):
+    """
+    Brings the store up to date with @data_frame. @known_hashes are the season hashes returned by the previous
+    update, @season_hashes those of @data_frame (computed here if not given): new (crop, season) pairs are
+    appended, pairs whose rows changed (corrected or added trial rows) are rebuilt from their rows, pairs no longer
+    in the data are removed, and unchanged pairs are not touched.
+    Returns the updated store and the season hashes of @data_frame.
+    """
+    if season_hashes is None:
+        season_hashes = get_season_hashes(data_frame)
+    if known_hashes is None:
+        known_hashes = {}
+    changed = [x for x, h in season_hashes.items() if known_hashes.get(x) != h]
+    stale = changed + [x for x in known_hashes if x not in season_hashes]
+
+    if store is not None and len(stale) > 0:
+        store = store[~is_in_seasons(store.index.get_level_values('crop'),
+                                     store.index.get_level_values('season'),
+                                     stale)]
+
+    rows = data_frame[is_in_seasons(data_frame['crop'], data_frame['season'], changed)]
+    if len(rows) > 0:
+        store = append_to_trend_store(store, rows, catalog_df)
+
+    return store, season_hashes
+
+
+##################
+# DERIVED TRENDS #
+##################
+
+def get_store_metrics(store):
+    return [x.replace('count-', '', 1) for x in store.columns if x.startswith('count-')]
+
+
+def pooled_statistics(store, metric, group_by_cols):
+    """Returns mean, std and count of @metric pooled over everything but @group_by_cols."""
+    stats = store[[f'{stat}-{metric}' for stat in STATS]].groupby(level=group_by_cols).sum()
+    count, total, total_sq = (stats[f'{stat}-{metric}'] for stat in STATS)
+
+    pooled = pd.DataFrame({'count': count}, index=stats.index)
+    pooled['mean'] = total / count.replace(0, np.nan)
+    variance = (total_sq - count * pooled['mean'] ** 2) / (count - 1).where(count > 1)
+    pooled['std'] = np.sqrt(variance.clip(lower=0))
+
+    return pooled
+
+
+def select_store(store, crop, location='ALL'):
+    """Store rows of @crop, limited to @location unless it is 'ALL' (same convention as filter_selection)."""
+    store = store.xs(crop, level='crop')
+    if location != 'ALL':
+        store = store[store.index.get_level_values('location') == location]
+    return store
+
+
+def season_means(store, metric):
+    """Cultivar x season matrix of @metric means, pooled over the locations of @store. Seasons are sorted."""
+    means = pooled_statistics(store, metric, ['cultivar', 'season'])['mean']
+    return means.unstack('season').sort_index(axis='columns')
+
+
+def compute_slope(season_means_df):
+    """Least-squares slope of each cultivar's season means, per season step. NaN-aware, vectorized over cultivars."""
+    y = season_means_df.to_numpy(dtype=float)
+    x = np.broadcast_to(np.arange(y.shape[1], dtype=float), y.shape)
+    observed = ~np.isnan(y)
+    n = observed.sum(axis=1)
+
+    x = np.where(observed, x, 0)
+    y = np.where(observed, y, 0)
+    sum_x, sum_y = x.sum(axis=1), y.sum(axis=1)
+    denominator = n * (x ** 2).sum(axis=1) - sum_x ** 2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = (n * (x * y).sum(axis=1) - sum_x * sum_y) / denominator
+
+    return pd.Series(np.where(n > 1, slope, np.nan), index=season_means_df.index)
+
+
+def compute_rank_trajectory(season_means_df, rank_ascending):
+    """Ranks cultivars within each season (dense, same as rank_metrics); cultivars missing a season stay NaN."""
+    return season_means_df.rank(ascending=rank_ascending, method='dense').astype('Int64')
+
+
+def compute_consistency(season_means_df):
+    """Consistency score in (0, 1]: 1 / (1 + coefficient of variation of the season means). 1 = no variation."""
+    cv = season_means_df.std(axis='columns') / season_means_df.mean(axis='columns').abs()
+    return 1 / (1 + cv)
+
+
+def compute_cultivar_trends(store, crop, metric, rank_ascending=False, location='ALL'):
+    """
+    Derives per-cultivar trends of @metric across seasons from the store, for @crop and @location ('ALL' pools
+    all locations): slope, consistency, pooled mean, number of seasons and the rank trajectory
+    (one rank column per season).
+    """
+    store = select_store(store, crop, location)
+    means = season_means(store, metric)
+    pooled = pooled_statistics(store, metric, ['cultivar'])
+
+    trends = pd.DataFrame({f'slope-{metric}': compute_slope(means).round(3),
+                           f'consistency-{metric}': compute_consistency(means).round(3),
+                           f'mean-{metric}': pooled['mean'].round(2),
+                           'seasons': means.notna().sum(axis='columns')})
+    trajectory = compute_rank_trajectory(means, rank_ascending)
+    trajectory.columns = [f'rank-{x}' for x in trajectory.columns]
+
+    return trends.join(trajectory).reset_index()
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from .data_cleaning import filter_selection, get_selections
+from .data_exporting import selection_file_name, selection_name
+from .data_ranking import get_overall_ranks, rank_selection, weighted_overall_rank
+
+# number of metrics listed as drivers of a cultivar's move
+N_DRIVERS = 3
+
+
+#################
+# DATA VERSIONS #
+#################
+# Versions live in @store_dir:
+#   index.json                        - list of {version, created_at, rows}, in ingest order (latest last)
+#   <version>/data.pkl, catalog.pkl   - the ingested data and catalog
+#   ranks/<selection>-<hash>.pkl      - cached category results (metric & rank frames) per selection, keyed by
+#                                       the content hash of the selection's rows, so versions share them
+#   diffs/<old>_<new>.json            - rank diff artifacts
+
+
+def hash_dataset(data_frame, catalog_df):
+    """Content hash of the data and the catalog, used as the version id."""
+    digest = hashlib.sha256()
+    for _df in [data_frame, catalog_df]:
+        digest.update(','.join(map(str, _df.columns)).encode())
+        digest.update(pd.util.hash_pandas_object(_df.astype(str), index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+def list_versions(store_dir):
+    index_path = os.path.join(store_dir, 'index.json')
+    if not os.path.exists(index_path):
+        return []
+    with open(index_path) as f:
+        return json.load(f)
+
+
+def get_latest_version(store_dir):
+    """Id of the most recently ingested version, None if the store is empty."""
+    versions = list_versions(store_dir)
+    return versions[-1]['version'] if versions else None
+
+
+def save_version(store_dir, data_frame, catalog_df):
+    """
+    Stores the dataset as the latest version. Content that was already stored (e.g. after a revert) is not written
+    again, its entry just moves to the end of the index. Returns the version id.
+    """
+    version = hash_dataset(data_frame, catalog_df)
+    versions = list_versions(store_dir)
+    stored = [x for x in versions if x['version'] == version]
+    if stored and versions[-1]['version'] == version:
+        return version
+
+    if stored:
+        entry = stored[0]
+    else:
+        os.makedirs(os.path.join(store_dir, version, 'ranks'), exist_ok=True)
+        data_frame.to_pickle(os.path.join(store_dir, version, 'data.pkl'))
+        catalog_df.to_pickle(os.path.join(store_dir, version, 'catalog.pkl'))
+        entry = {'version': version,
+                 'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                 'rows': len(data_frame)}
+
+    versions = [x for x in versions if x['version'] != version] + [entry]
+    with open(os.path.join(store_dir, 'index.json'), 'w') as f:
+        json.dump(versions, f, indent=2)
+
+    return version
+
+
+def load_version(store_dir, version):
+    data_frame = pd.read_pickle(os.path.join(store_dir, version, 'data.pkl'))
+    catalog_df = pd.read_pickle(os.path.join(store_dir, version, 'catalog.pkl'))
+    return data_frame, catalog_df
+
+
+def get_selection_hashes(data_frame, catalog_df):
+    """
+    {selection: content hash} of every selection of the dataset. A selection's ranking depends only on its rows
+    and the catalog, so selections whose hash did not change between versions rank the same.
+    """
+    digest = hashlib.sha256(hash_dataset(data_frame.iloc[:0], catalog_df).encode())
+    row_hashes = pd.Series(pd.util.hash_pandas_object(data_frame.astype(str), index=False).to_numpy(),
+                           index=data_frame.index)
+
+    selection_hashes = {}
+    for selection in get_selections(data_frame):
+        selection_digest = digest.copy()
+        selection_digest.update(row_hashes[filter_selection(data_frame, *selection).index].to_numpy().tobytes())
+        selection_hashes[selection] = selection_digest.hexdigest()[:16]
+
+    return selection_hashes
+
+
+def get_rank_matrices(store_dir, dataset, selection, selection_hash, workers=1):
+    """
+    Category results of a selection of the (data, catalog) @dataset, computed once per @selection_hash and then
+    read from the store, whichever version they were computed for.
+    """
+    path = os.path.join(store_dir, 'ranks', f'{selection_file_name(selection)}-{selection_hash}.pkl')
+    if os.path.exists(path):
+        return pd.read_pickle(path)
+
+    category_results = rank_selection(*dataset, *selection, workers=workers)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pd.to_pickle(category_results, path)
+
+    return category_results
+
+
+#############
+# RANK DIFF #
+#############
+
+def get_metric_ranks(category_results):
+    """Cultivar x metric matrix of all metric ranks ('rank-<metric>' columns) across categories."""
+    metric_ranks = [df_rank.set_index('cultivar').filter(regex='^rank-') for _, df_rank in category_results.values()]
+    metric_ranks = pd.concat(metric_ranks, axis='columns')
+    return metric_ranks.loc[:, ~metric_ranks.columns.duplicated()]
+
+
+def get_drivers(old_metric_ranks, new_metric_ranks, cultivars, n_drivers=N_DRIVERS):
+    """For each cultivar, the metrics whose ranks changed the most, as 'metric (+delta)' strings."""
+    columns = old_metric_ranks.columns.intersection(new_metric_ranks.columns)
+    deltas = (new_metric_ranks.reindex(index=cultivars, columns=columns)
+              - old_metric_ranks.reindex(index=cultivars, columns=columns)).to_numpy(dtype=float)
+    if deltas.shape[1] == 0:
+        return pd.Series('', index=cultivars)
+
+    # largest absolute deltas first, NaNs (metric missing in a version) last
+    order = np.argsort(-np.nan_to_num(np.abs(deltas), nan=-1), axis=1, kind='stable')[:, :n_drivers]
+    top_deltas = np.take_along_axis(deltas, order, axis=1)
+    metrics = np.asarray([x.replace('rank-', '', 1) for x in columns])[order]
+
+    drivers = [', '.join(f'{m} ({d:+.0f})' for m, d in zip(row_metrics, row_deltas) if not np.isnan(d) and d != 0)
+               for row_metrics, row_deltas in zip(metrics, top_deltas)]
+    return pd.Series(drivers, index=cultivars)
+
+
+def compute_rank_diff(old_results, new_results, weights, metric_ranks=None):
+    """
+    Overall rank deltas between two versions of a selection for one set of weights. Returns only the
+    cultivars that moved, appeared or disappeared, with the metrics that drove the move.
+    @metric_ranks are the (old, new) get_metric_ranks, when already computed for another set of weights.
+    """
+    if metric_ranks is None:
+        metric_ranks = get_metric_ranks(old_results), get_metric_ranks(new_results)
+
+    old_rank = weighted_overall_rank(get_overall_ranks(old_results), weights).set_index('cultivar')['overall_rank']
+    new_rank = weighted_overall_rank(get_overall_ranks(new_results), weights).set_index('cultivar')['overall_rank']
+
+    diff = pd.DataFrame({'old_rank': old_rank, 'new_rank': new_rank})
+    diff['delta'] = diff['new_rank'] - diff['old_rank']
+    diff = diff[diff['delta'].fillna(1) != 0]
+
+    diff['drivers'] = get_drivers(*metric_ranks, diff.index)
+    diff = diff.rename_axis('cultivar').reset_index()
+
+    return diff.sort_values('delta', key=lambda x: -x.abs(), na_position='last')
+
+
+def diff_versions(store_dir, old_version, new_version, presets, workers=1):
+    """
+    Diffs the rankings of two stored versions for every selection of the new version and every weight preset
+    ({preset name: list of 8 slider weights}). Only selections whose rows changed are ranked and compared.
+    Writes the diff artifact and returns its path.
+    """
+    old_dataset, new_dataset = load_version(store_dir, old_version), load_version(store_dir, new_version)
+    old_hashes, new_hashes = get_selection_hashes(*old_dataset), get_selection_hashes(*new_dataset)
+    new_selections = list(new_hashes)
+
+    diffs = []
+    for selection in new_selections:
+        if old_hashes.get(selection, new_hashes[selection]) == new_hashes[selection]:
+            # new selection, or the same rows: nothing to compare
+            continue
+        old_results = get_rank_matrices(store_dir, old_dataset, selection, old_hashes[selection], workers)
+        new_results = get_rank_matrices(store_dir, new_dataset, selection, new_hashes[selection], workers)
+        metric_ranks = get_metric_ranks(old_results), get_metric_ranks(new_results)
+        for preset, weights in presets.items():
+            diff = compute_rank_diff(old_results, new_results, weights, metric_ranks)
+            if len(diff) > 0:
+                diffs.append({'selection': selection_name(selection), 'preset': preset,
+                              'moved': json.loads(diff.to_json(orient='records'))})
+
+    os.makedirs(os.path.join(store_dir, 'diffs'), exist_ok=True)
+    path = os.path.join(store_dir, 'diffs', f'{old_version}_{new_version}.json')
+    with open(path, 'w') as f:
+        json.dump({'old_version': old_version, 'new_version': new_version,
+                   'new_selections': [selection_name(x) for x in new_selections if x not in old_hashes],
+                   'diffs': diffs}, f, separators=(',', ':'))
+
+    return path
@@ -1,7 +1,70 @@
+from functools import lru_cache
 import altair as alt
-import matplotlib.pyplot as plt
+import matplotlib
+import numpy as np
+import pandas as pd
 import streamlit as st
 
+# tables with more rows show ranks as progress bars instead of a colored pandas Styler
+STYLER_MAX_ROWS = 1000
+# number of rank table styles kept in the server-side cache, shared by all sessions
+RENDER_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=None)
+def get_cmap(cmap_name='summer'):
+    return matplotlib.colormaps[cmap_name]
+
+
+def compute_gradient_colors(values, cmap_name='summer'):
+    """
+    Vectorized equivalent of Styler.background_gradient for one column: returns the background colors and
+    the text colors (light text on dark backgrounds) as hex strings.
+    """
+    values = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    observed = values[~np.isnan(values)]
+    value_range = observed.max() - observed.min() if len(observed) > 0 else 0
+    normed = (values - observed.min()) / value_range if value_range > 0 else np.zeros_like(values)
+    rgba = get_cmap(cmap_name)(normed)
+
+    # relative luminance, same threshold as Styler.background_gradient
+    linear = np.where(rgba[:, :3] <= 0.03928, rgba[:, :3] / 12.92, ((rgba[:, :3] + 0.055) / 1.055) ** 2.4)
+    luminance = linear @ np.array([0.2126, 0.7152, 0.0722])
+
+    rgb = np.round(rgba[:, :3] * 255).astype(int)
+    background = np.array([f'#{r:02x}{g:02x}{b:02x}' for r, g, b in rgb], dtype=object)
+    background[np.isnan(values)] = ''
+    text = np.where(luminance < 0.408, '#f1f1f1', '#000000')
+
+    return background, text
+
+
+@st.cache_data(max_entries=RENDER_CACHE_SIZE, show_spinner=False)
+def compute_rank_table_css(rank_df, rank_col, cmap_name='summer'):
+    """
+    Css of @rank_col colored by rank, one entry per row. Cached by the table's content across sessions and
+    reruns; a Styler is rebuilt from it on every run, which is cheap.
+    """
+    background, text = compute_gradient_colors(rank_df[rank_col], cmap_name)
+    return [f'background-color: {b}; color: {t};' if b else '' for b, t in zip(background, text)]
+
+
+def show_rank_table(rank_df, rank_col, cmap_name='summer'):
+    """
+    Shows a rank table with @rank_col colored by rank. Tables too large for a pandas Styler show @rank_col
+    as a progress bar scaled to the rank range instead.
+    """
+    if len(rank_df) > STYLER_MAX_ROWS:
+        ranks = pd.to_numeric(rank_df[rank_col], errors='coerce')
+        rank_column = st.column_config.ProgressColumn(rank_col, format='%d',
+                                                      min_value=int(ranks.min()) if ranks.notna().any() else 0,
+                                                      max_value=int(ranks.max()) if ranks.notna().any() else 1)
+        st.dataframe(rank_df, hide_index=True, column_config={rank_col: rank_column})
+        return
+
+    css = compute_rank_table_css(rank_df, rank_col, cmap_name)
+    st.dataframe(rank_df.style.apply(lambda _: css, subset=[rank_col]), hide_index=True)
+
 
 def plot_column(column_name, metric_df):
     viz_title = f"{column_name.replace('_', ' ').title()} vs Cultivar"
@@ -15,11 +78,8 @@ def plot_column(column_name, metric_df):
     st.altair_chart(chart, use_container_width=True)
 
 
-def visualize_metrics(metric_string, metric_df, rank_df, catalog, idx, cmap=None):
+def visualize_metrics(metric_string, metric_df, rank_df, catalog, idx, cmap='summer'):
     """Simple visualizing algorithm displaying a class of metrics, their ranks, and their charts."""
-    if cmap is None:
-        cmap = plt.cm.get_cmap('summer')
-
     metric_string_pretty = metric_string.replace('_', ' ').title()
 
     st.markdown(f"## {idx}. {metric_string_pretty} Analysis")
@@ -55,6 +115,27 @@ def visualize_metrics(metric_string, metric_df, rank_df, catalog, idx, cmap=None
     st.text(
         f"The overall rank takes all the {metric_string_pretty} metrics, \nranks each column separately (from best to worst) "
         f"\nand then computes the overall rank from all ranks.")
-    st.dataframe(rank_df.style.background_gradient(cmap=cmap, subset=[f'overall_rank-{metric_string}']),
-                 hide_index=True)
+    show_rank_table(rank_df, f'overall_rank-{metric_string}', cmap)
+    st.divider()
+
+
+def visualize_trends(metric, trends_df, idx):
+    """Displays per-cultivar trends of a metric across seasons and the cultivars' rank trajectories."""
+    metric_pretty = metric.replace('_', ' ').title()
+
+    st.markdown(f"## {idx}. {metric_pretty} Across Seasons")
+    st.text(
+        f"Slope: average change of {metric_pretty} per season. "
+        f"\nConsistency: 1 means the same {metric_pretty} every season, lower means less consistent.")
+    st.dataframe(trends_df, hide_index=True)
+
+    rank_cols = [x for x in trends_df.columns if x.startswith('rank-')]
+    trajectory = trends_df.melt(id_vars='cultivar', value_vars=rank_cols, var_name='season', value_name='rank')
+    trajectory['season'] = trajectory['season'].str.replace('rank-', '', n=1)
+    chart = alt.Chart(trajectory.dropna(), title=alt.Title(f"{metric_pretty} rank by season")).mark_line(point=True).encode(
+        x='season:O',
+        y=alt.Y('rank:Q').scale(reverse=True),
+        color=alt.Color('cultivar').scale(scheme='tableau20'),
+    )
+    st.altair_chart(chart, use_container_width=True)
     st.divider()
@@ -1,20 +1,27 @@
+import threading
 import numpy as np
 
+from .data_cleaning import get_quality_report, get_selections
+from .data_exporting import EXPORT_FORMATS, discard_export, start_export
 from .data_metrics import get_wheat_classes
+from .data_ranking import rank_selection
+from .data_similarity import build_similarity_index, find_similar_cultivars
+from .data_trends import (compute_cultivar_trends, get_season_hashes, get_store_metrics, select_store,
+                          update_trend_store)
+from .data_visualizing import visualize_trends
 
 import streamlit as st
 from streamlit import session_state as ss
 
 
-def select_user_parameters(data_frame, blup_df):
+def select_user_parameters(data_frame):
+    """Lets users pick the crop, location and season to analyze. Returns the picked (crop, location, season)."""
     crop_options = data_frame.crop.unique()
     crop_id = st.selectbox(
         '**Pick the crop**',
         crop_options
     )
     data_frame = data_frame[data_frame.crop == crop_id]
-    # todo: handle BLUP data better
-    blup_df = blup_df[blup_df.crop == crop_id]
 
     # Select location
     location_options = np.append(data_frame.location.unique(), ['ALL'])
@@ -24,8 +31,6 @@ def select_user_parameters(data_frame, blup_df):
     )
     if location != 'ALL':
         data_frame = data_frame[data_frame.location == location]
-    # todo: handle BLUP data better
-    blup_df = blup_df[blup_df.location == location]
 
     # Select season
     season_options = np.append(data_frame.season.unique(), ['ALL'])
@@ -33,12 +38,19 @@ def select_user_parameters(data_frame, blup_df):
         '**Pick the season**',
         season_options
     )
-    if season != 'ALL':
-        data_frame = data_frame[data_frame.season == season]
-        # todo: handle BLUP data better
-        blup_df = blup_df[blup_df.season.astype(str) == str(season)]
 
-    return data_frame, blup_df
+    return crop_id, location, season
+
+
+@st.cache_data(show_spinner=False)
+def cached_rank_selection(data_frame, catalog, crop, location, season, workers=1):
+    """
+    Cached rank_selection, shared by the app reruns and the export worker.
+    Returns the category results and the data-quality report collected while cleaning.
+    """
+    report = []
+    category_results = rank_selection(data_frame, catalog, crop, location, season, report, workers)
+    return category_results, get_quality_report(report)
 
 
 def select_ranking_importance_for_metrics(boundary_string):
@@ -142,3 +154,122 @@ def present_wheat_class(data_frame):
     else:
         data_frame['wheat_class'] = data_frame[class_cols].apply(lambda x: get_wheat_classes(*x), axis=1)
         st.dataframe(data_frame[['cultivar', 'wheat_class'] + class_cols], hide_index=True)
+
+
+def present_export_bundle(data_frame, catalog, selection, weights, workers=1):
+    """
+    Lets users export the overall ranking with all category metrics and ranks, either for the current selection
+    or for all selections. The bundle is written by a background worker, so the page stays responsive.
+    """
+    st.markdown("## Export")
+    scope = st.radio('**What to export**', ['Current selection', 'All selections'], horizontal=True)
+    export_format = st.selectbox('**Export format**', list(EXPORT_FORMATS))
+
+    if st.button(label="Prepare export"):
+        selections = [selection] if scope == 'Current selection' else get_selections(data_frame)
+
+        def rank_fn(crop, location, season):
+            return cached_rank_selection(data_frame, catalog, crop, location, season, workers)[0]
+
+        # only the latest export is kept on the server
+        if 'export_job' in ss:
+            discard_export(ss['export_job'][1])
+        ss['export_job'] = (export_format, start_export(selections, rank_fn, weights, export_format))
+
+    if 'export_job' not in ss:
+        return
+
+    job_format, job = ss['export_job']
+    if not job.done():
+        st.info("The export is being prepared in the background.")
+        st.button(label="Check export status")
+    elif job.exception() is not None:
+        st.error(f"Export failed: {job.exception()}")
+    else:
+        extension, mime = EXPORT_FORMATS[job_format]
+        with open(job.result(), 'rb') as file_obj:
+            st.download_button(label="Download export", data=file_obj, file_name=f"cultivar_ranking.{extension}",
+                               mime=mime)
+
+
+@st.cache_resource(show_spinner=False)
+def get_shared_trend_store():
+    """
+    Trend store shared by all sessions and reruns. Seasons are appended to it as they show up in the data
+    and rebuilt when their rows change.
+    """
+    return {'store': None, 'season_hashes': None, 'lock': threading.Lock()}
+
+
+def update_shared_trend_store(data_frame, catalog):
+    shared = get_shared_trend_store()
+    # hashing is the per-rerun cost, done outside the lock so sessions don't wait on each other for it
+    season_hashes = get_season_hashes(data_frame)
+    with shared['lock']:
+        shared['store'], shared['season_hashes'] = update_trend_store(shared['store'], data_frame, catalog,
+                                                                      shared['season_hashes'], season_hashes)
+    return shared['store']
+
+
+def present_cultivar_trends(data_frame, catalog, crop, location, idx):
+    """Lets users pick a metric and shows how cultivars trend across seasons for it, at the picked location."""
+    store = update_shared_trend_store(data_frame, catalog)
+    if store is None or crop not in store.index.get_level_values('crop'):
+        return
+    if location != 'ALL' and location not in select_store(store, crop).index.get_level_values('location'):
+        return
+
+    rankable = catalog[catalog.rank_ascending.notna()]
+    metric_options = [x for x in rankable.metric if x in get_store_metrics(store)]
+    yield_metrics = [x for x in metric_options if x in list(catalog[catalog.type == 'yield'].metric)]
+    metric = st.selectbox('**Pick the metric to trend across seasons**',
+                          metric_options,
+                          index=metric_options.index(yield_metrics[0]) if yield_metrics else 0)
+    if metric is None:
+        return
+
+    rank_ascending = bool(list(rankable[rankable.metric == metric]['rank_ascending'])[0])
+    visualize_trends(metric, compute_cultivar_trends(store, crop, metric, rank_ascending, location), idx)
+
+
+@st.cache_data(show_spinner=False)
+def cached_similarity_index(category_results, category_weights):
+    return build_similarity_index(category_results, category_weights)
+
+
+def present_similar_cultivars(category_results, weights, idx):
+    """Lets users pick a cultivar and shows the cultivars behaving most like it, weighted like the ranking."""
+    st.markdown(f"## {idx}. Similar Cultivars")
+    st.text("Cultivars closest to the picked one across all ranked metrics, \nweighted by the ranking importance.")
+    index = cached_similarity_index(category_results, dict(zip(category_results, weights)))
+    if len(index['features']) == 0:
+        st.text("No metrics available to compare cultivars.")
+        return
+    if len(index['cultivars']) < 2:
+        st.text("At least two cultivars are needed to compare them.")
+        return
+
+    max_k = len(index['cultivars']) - 1
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        cultivar = st.selectbox('**Pick the cultivar**', index['cultivars'])
+    with col2:
+        k = st.number_input('**How many**', min_value=1, max_value=max_k, value=min(5, max_k))
+
+    st.dataframe(find_similar_cultivars(index, cultivar, k), hide_index=True)
+    st.divider()
+
+
+def present_quality_report(quality_report):
+    """Shows what the cleaning dropped or failed to coerce, and why."""
+    st.markdown("## Data Quality")
+    if len(quality_report) == 0:
+        st.text("Nothing was dropped while cleaning the data.")
+        return
+
+    st.text("Rows, columns and values dropped or not coerced while cleaning the data.")
+    summary = quality_report.fillna({'column': ''}).groupby(['step', 'reason', 'column'], as_index=False)['count'].sum()
+    st.dataframe(summary, hide_index=True)
+    with st.expander("Show details per cultivar and trial"):
+        st.dataframe(quality_report, hide_index=True)
+    st.divider()
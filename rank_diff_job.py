@@ -0,0 +1,66 @@
+"""
+Versions the trial data and reports which cultivars moved in the ranking since the previous version.
+
+    $ python rank_diff_job.py --sheet-id <google sheet id> [--presets presets.json]
+
+The presets file maps preset names to the 8 ranking weights, in slider order
+(boundary, yield, quality, diseases, agronomist, abiotic, weed competition, morphological).
+"""
+import argparse
+import json
+
+import pandas as pd
+
+from helpers.data_loading import get_dfs_for_cultivar_ranker
+from helpers.data_versioning import diff_versions, get_latest_version, save_version
+
+CATALOG_SHEET = "Metrics catalog"
+CROP_SHEETS = ["Wheat", "Wheat relatives", "Peas"]
+DEFAULT_PRESETS = {'equal': [12] * 8}
+
+
+def load_data(sheet_ids):
+    df, catalog = pd.DataFrame(), pd.DataFrame()
+    for sheet in sheet_ids:
+        _df, catalog = get_dfs_for_cultivar_ranker(sheet, CATALOG_SHEET, crop_sheets=CROP_SHEETS)
+        df = pd.concat([df, _df], ignore_index=True)
+    return df, catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sheet-id', nargs='+', required=True)
+    parser.add_argument('--store-dir', default='data_versions')
+    parser.add_argument('--presets', help='JSON file with {preset name: [8 weights]}')
+    parser.add_argument('--old-version', help='version to diff against, the latest version before this run by default')
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    presets = DEFAULT_PRESETS
+    if args.presets:
+        with open(args.presets) as f:
+            presets = json.load(f)
+
+    latest_version = get_latest_version(args.store_dir)
+    new_version = save_version(args.store_dir, *load_data(args.sheet_id))
+    if new_version == latest_version and args.old_version is None:
+        # nothing changed since the last run
+        return
+
+    old_version = args.old_version or latest_version
+    if old_version is None or old_version == new_version:
+        print(f"Data version {new_version}: no previous version to compare with.")
+        return
+
+    path = diff_versions(args.store_dir, old_version, new_version, presets, args.workers)
+    with open(path) as f:
+        diffs = json.load(f)['diffs']
+
+    print(f"Data version {old_version} -> {new_version}: {len(diffs)} selection/preset rankings changed.")
+    for diff in diffs:
+        print(f"- {diff['selection']} ({diff['preset']}): {len(diff['moved'])} cultivars moved")
+    print(f"Diff written to {path}")
+
+
+if __name__ == '__main__':
+    main()
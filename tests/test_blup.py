@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from helpers.data_metrics import compute_blup_df, compute_cultivar_blups
+
+
+def make_balanced_trials(n_trials=6, n_cultivars=8, noise=1.0, seed=0):
+    """Every cultivar in every trial, one observation each."""
+    rng = np.random.default_rng(seed)
+    trial_effects = rng.normal(0, 3, n_trials)
+    cultivar_effects = rng.normal(0, 1, n_cultivars)
+    rows = [(f't{j}', f'c{i}', 10 + trial_effects[j] + cultivar_effects[i] + rng.normal(0, noise))
+            for j in range(n_trials) for i in range(n_cultivars)]
+    return pd.DataFrame(rows, columns=['trial_id', 'cultivar', 'grain_yield'])
+
+
+def test_balanced_design_matches_closed_form():
+    data_frame = make_balanced_trials()
+    y = data_frame.pivot(index='cultivar', columns='trial_id', values='grain_yield')
+    n_cultivars, n_trials = y.shape
+
+    # two-way ANOVA without replication: residual and cultivar variance components
+    cultivar_means, trial_means, grand_mean = y.mean(axis=1), y.mean(axis=0), y.to_numpy().mean()
+    residuals = y.sub(cultivar_means, axis=0).sub(trial_means, axis=1) + grand_mean
+    residual_var = (residuals.to_numpy() ** 2).sum() / ((n_trials - 1) * (n_cultivars - 1))
+    cultivar_var = cultivar_means.var(ddof=1) - residual_var / n_trials
+    assert cultivar_var > 0
+    variance_ratio = residual_var / cultivar_var
+
+    # in a balanced design BLUPs are the cultivar deviations shrunk by n_trials / (n_trials + lambda)
+    expected = grand_mean + n_trials / (n_trials + variance_ratio) * (cultivar_means - grand_mean)
+
+    blups = compute_cultivar_blups(data_frame, 'grain_yield')
+    pd.testing.assert_series_equal(blups, expected.rename('grain_yield'), check_names=False, rtol=1e-6)
+
+
+def test_no_residual_variance_falls_back_to_raw_means():
+    # y = trial + cultivar exactly: lambda would be 0 and the mixed model equations singular
+    data_frame = make_balanced_trials(noise=0)
+    assert compute_cultivar_blups(data_frame, 'grain_yield') is None
+    assert len(compute_blup_df(data_frame, ['grain_yield'])) == 0
+
+
+@pytest.mark.parametrize('drop_fraction', [0.2, 0.5])
+def test_unbalanced_design_has_no_missing_blups(drop_fraction):
+    data_frame = make_balanced_trials(n_trials=10, n_cultivars=20)
+    data_frame = data_frame.sample(frac=1 - drop_fraction, random_state=1)
+
+    blups = compute_cultivar_blups(data_frame, 'grain_yield')
+    assert blups.notna().all()
+    # shrinkage: BLUPs vary less than the raw cultivar means
+    assert blups.var() < data_frame.groupby('cultivar')['grain_yield'].mean().var()
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from helpers.data_metrics import compile_expression, compute_derived_metrics
+
+
+def make_catalog(definitions):
+    """Catalog with the given derived metrics {metric: (expression, data_type)}."""
+    return pd.DataFrame([(metric, expression, data_type) for metric, (expression, data_type) in definitions.items()],
+                        columns=['metric', 'expression', 'data_type'])
+
+
+@pytest.fixture
+def data_frame():
+    return pd.DataFrame({'grain_yield': [6.0, 8.0, 0.0, np.nan],
+                         'plant_height': [80.0, 0.0, 0.0, 90.0],
+                         'date_of_emergence': pd.to_datetime(['2021-03-01', '2021-03-05', None, '2021-03-02']),
+                         'date_of_heading': pd.to_datetime(['2021-05-01', '2021-05-20', '2021-05-02', None])})
+
+
+@pytest.mark.parametrize('expression', ['__import__("os").system("ls")', 'grain_yield.__class__',
+                                        '(lambda: 1)()', '[x for x in grain_yield]', 'open("f")',
+                                        'grain_yield if plant_height else 0', 'grain_yield[0]'])
+def test_expression_whitelist_rejects(expression):
+    with pytest.raises(ValueError):
+        compile_expression(expression)
+
+
+def test_expression_inputs():
+    _, inputs = compile_expression('where(grain_yield > 7, sqrt(grain_yield), 0) / plant_height')
+    assert sorted(inputs) == ['grain_yield', 'plant_height']
+
+
+def test_defaults_and_chained_definitions(data_frame):
+    catalog = make_catalog({'yield_per_height': ('grain_yield / plant_height * 100', 'float'),
+                            'yield_per_height_class': ('where(yield_per_height > 7.5, 1, 0)', 'integer'),
+                            'unknown_input': ('missing_metric * 2', 'float')})
+    result = compute_derived_metrics(data_frame, catalog)
+
+    assert result['days_between_emergence_and_heading'].tolist()[:2] == [61, 76]
+    assert result['days_between_emergence_and_heading'].iloc[2:].isna().all()
+    assert result['yield_per_height'].iloc[0] == pytest.approx(7.5)
+    assert str(result['yield_per_height_class'].dtype) == 'Int64'
+    assert result['yield_per_height_class'].iloc[0] == 0
+    assert 'unknown_input' not in result
+
+
+def test_division_by_zero_gives_missing_values(data_frame):
+    catalog = make_catalog({'ratio': ('grain_yield / plant_height', 'float'),
+                            'ratio_class': ('grain_yield / plant_height', 'integer'),
+                            'constant': ('1 / 0', 'float')})
+    failed = []
+    result = compute_derived_metrics(data_frame, catalog, failed)
+
+    # 8 / 0 is inf, 0 / 0 is nan: both missing
+    assert result['ratio'].iloc[1:3].isna().all() and not np.isinf(result['ratio']).any()
+    assert result['ratio_class'].iloc[1:3].isna().all()
+    assert result['ratio_class'].iloc[0] == 0
+    assert [metric for metric, _ in failed] == ['constant']
+
+
+def test_bad_definitions_are_skipped(data_frame):
+    catalog = make_catalog({'syntax_error': ('grain_yield *', 'float'),
+                            'unsupported': ('grain_yield.__class__', 'float'),
+                            'good': ('grain_yield * 2', 'float')})
+    failed = []
+    result = compute_derived_metrics(data_frame, catalog, failed)
+
+    assert result['good'].iloc[0] == 12
+    assert [metric for metric, _ in failed] == ['syntax_error', 'unsupported']
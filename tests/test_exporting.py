@@ -0,0 +1,91 @@
+import io
+import json
+import os
+import zipfile
+
+import pandas as pd
+import pytest
+
+from helpers.data_exporting import ERROR_TABLE, discard_export, export_bundle, start_export
+
+SELECTIONS = [('wheat', 'location_0', '2020/2021'), ('wheat', 'location_1', '2020/2021'), ('peas', 'ALL', 'ALL')]
+WEIGHTS = [1, 1]
+
+
+def rank_fn(crop, location, season):
+    """Category results of two categories; peas have no boundary metric and fail to rank."""
+    if crop == 'peas':
+        raise KeyError('protein_content')
+    cultivars = [f'{location}_cultivar_{i}' for i in range(3)]
+    results = {}
+    for offset, category in enumerate(['yield', 'quality']):
+        ranks = [(i + offset) % 3 + 1 for i in range(3)]
+        results[category] = (pd.DataFrame({'cultivar': cultivars, f'{category}_metric': [1.5, None, 3.25]}),
+                             pd.DataFrame({'cultivar': cultivars, f'rank-{category}_metric': ranks,
+                                           f'overall_rank-{category}': ranks}))
+    return results
+
+
+def expected_tables(selection):
+    return {f'{category}-{kind}': table for category, (metrics, ranks) in rank_fn(*selection).items()
+            for kind, table in [('metrics', metrics), ('rank', ranks)]}
+
+
+@pytest.fixture
+def export(request):
+    path = export_bundle(SELECTIONS, rank_fn, WEIGHTS, request.param, chunk_size=2)
+    yield path
+    os.remove(path)
+
+
+@pytest.mark.parametrize('export', ['json'], indirect=True)
+def test_json_round_trip(export):
+    with open(export) as f:
+        bundle = json.load(f)
+
+    assert list(bundle) == ['wheat-location_0-2020/2021', 'wheat-location_1-2020/2021', 'peas-ALL-ALL']
+    assert bundle['peas-ALL-ALL'] == {ERROR_TABLE: [{'error': "KeyError: 'protein_content'"}]}
+    for table_name, table in expected_tables(SELECTIONS[0]).items():
+        pd.testing.assert_frame_equal(pd.DataFrame(bundle['wheat-location_0-2020/2021'][table_name]), table,
+                                      check_dtype=False)
+    assert len(bundle['wheat-location_0-2020/2021']['overall_rank']) == 3
+
+
+@pytest.mark.parametrize('export', ['xlsx'], indirect=True)
+def test_xlsx_round_trip(export):
+    sheets = pd.read_excel(export, sheet_name=None)
+
+    index = sheets['index']
+    tables = ['overall_rank', 'yield-metrics', 'yield-rank', 'quality-metrics', 'quality-rank']
+    assert index.table.tolist() == tables * 2 + [ERROR_TABLE]
+    assert index.season.tolist()[0] == '2020/2021'
+    assert sheets[f'3_{ERROR_TABLE}'].error.tolist() == ["KeyError: 'protein_content'"]
+    for table_name, table in expected_tables(SELECTIONS[1]).items():
+        pd.testing.assert_frame_equal(sheets[f'2_{table_name}'], table, check_dtype=False)
+
+
+@pytest.mark.parametrize('export', ['parquet'], indirect=True)
+def test_parquet_round_trip(export):
+    with zipfile.ZipFile(export) as archive:
+        names = archive.namelist()
+        tables = {name: pd.read_parquet(io.BytesIO(archive.read(name))) for name in names}
+
+    # one folder per selection, seasons like '2020/2021' don't nest folders
+    assert {x.split('/')[0] for x in names} == {'wheat-location_0-2020_2021', 'wheat-location_1-2020_2021',
+                                                'peas-ALL-ALL'}
+    assert all(x.count('/') == 1 for x in names)
+    assert tables[f'peas-ALL-ALL/{ERROR_TABLE}.parquet'].error.tolist() == ["KeyError: 'protein_content'"]
+    for table_name, table in expected_tables(SELECTIONS[0]).items():
+        pd.testing.assert_frame_equal(tables[f'wheat-location_0-2020_2021/{table_name}.parquet'], table)
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        start_export(SELECTIONS, rank_fn, WEIGHTS, 'csv')
+
+
+def test_discard_export_removes_the_file():
+    job = start_export(SELECTIONS[:1], rank_fn, WEIGHTS, 'json')
+    path = job.result()
+    discard_export(job)
+    assert not os.path.exists(path)
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_data import make_catalog, make_trial_data
+from helpers.data_ranking import rank_selection
+from helpers.data_similarity import build_similarity_index, find_similar_cultivars
+
+
+def make_category_results():
+    cultivars = ['a', 'b', 'c', 'd']
+    metrics = pd.DataFrame({'cultivar': cultivars,
+                            'grain_yield': [5.0, 5.5, 7.0, 6.8],
+                            'plant_height': pd.array([80, pd.NA, 95, 94], dtype='Float64')})
+    ranks = pd.DataFrame({'cultivar': cultivars, 'rank-grain_yield': [4, 3, 1, 2], 'rank-plant_height': [3, 4, 1, 2]})
+    return {'yield': (metrics, ranks)}
+
+
+def test_nullable_metric_with_missing_values():
+    index = build_similarity_index(make_category_results())
+    assert index['observed'].sum(axis=0).tolist() == [4, 3]
+    assert not np.isnan(index['z']).any()
+
+    similar = find_similar_cultivars(index, 'b', k=3)
+    assert 'b' not in similar.cultivar.tolist()
+    assert (similar.shared_metrics == 1).all()
+    assert find_similar_cultivars(index, 'c', k=1).cultivar.tolist() == ['d']
+
+
+def test_ranked_selection_with_a_missing_integer_metric():
+    catalog = make_catalog(metrics_per_category=2)
+    data_frame = make_trial_data(catalog, n_cultivars=10, n_locations=1, n_seasons=1)
+    # integer metrics become Float64 when aggregated; one cultivar has no value at all
+    data_frame.loc[data_frame.genotype == 'cultivar_0', 'yield_metric_0'] = np.nan
+
+    category_results = rank_selection(data_frame, catalog, 'wheat', 'location_0', 2020)
+    index = build_similarity_index(category_results)
+
+    assert len(find_similar_cultivars(index, 'cultivar_0', k=3)) == 3
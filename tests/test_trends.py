@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic_data import make_catalog, make_trial_data
+from helpers.data_trends import compute_cultivar_trends, update_trend_store
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return make_catalog(metrics_per_category=2)
+
+
+@pytest.fixture(scope='module')
+def trial_data(catalog):
+    data_frame = make_trial_data(catalog, n_cultivars=8, n_locations=2, n_seasons=4, n_plots=2)
+    data_frame['season'] = data_frame['season'].map(lambda x: f'{x}/{x + 1}')
+    return data_frame
+
+
+def assert_same_store(actual, expected):
+    pd.testing.assert_frame_equal(actual.sort_index(), expected.sort_index(), check_like=True)
+
+
+def test_incremental_updates_equal_a_full_rebuild(catalog, trial_data):
+    seasons = sorted(trial_data.season.unique())
+    store, hashes = update_trend_store(None, trial_data[trial_data.season.isin(seasons[:2])], catalog)
+
+    # new seasons
+    store, hashes = update_trend_store(store, trial_data, catalog, hashes)
+    assert_same_store(store, update_trend_store(None, trial_data, catalog)[0])
+
+    # corrected values and added rows of a season already in the store
+    changed = trial_data.copy()
+    changed.loc[changed.season == seasons[1], 'yield_metric_1'] += 10
+    changed = pd.concat([changed, changed[changed.season == seasons[0]].head(3)], ignore_index=True)
+    store, hashes = update_trend_store(store, changed, catalog, hashes)
+    assert_same_store(store, update_trend_store(None, changed, catalog)[0])
+
+    # a season removed from the data
+    removed = changed[changed.season != seasons[2]]
+    store, hashes = update_trend_store(store, removed, catalog, hashes)
+    assert_same_store(store, update_trend_store(None, removed, catalog)[0])
+
+
+def test_unchanged_data_leaves_the_store_untouched(catalog, trial_data):
+    store, hashes = update_trend_store(None, trial_data, catalog)
+    assert update_trend_store(store, trial_data.copy(), catalog, hashes)[0] is store
+
+
+def test_unparseable_values(catalog, trial_data):
+    data_frame = trial_data.astype({'yield_metric_1': object})
+    data_frame.loc[data_frame.index[:5], 'yield_metric_1'] = 'canceled'
+
+    store, _ = update_trend_store(None, data_frame, catalog)
+    trends = compute_cultivar_trends(store, 'wheat', 'yield_metric_1')
+    assert trends['mean-yield_metric_1'].notna().all()
+
+
+def test_trends_per_location(catalog, trial_data):
+    store, _ = update_trend_store(None, trial_data, catalog)
+    location_store, _ = update_trend_store(None, trial_data[trial_data.location == 'location_1'], catalog)
+
+    pd.testing.assert_frame_equal(compute_cultivar_trends(store, 'wheat', 'yield_metric_1', location='location_1'),
+                                  compute_cultivar_trends(location_store, 'wheat', 'yield_metric_1'))
+    assert not np.allclose(compute_cultivar_trends(store, 'wheat', 'yield_metric_1')['mean-yield_metric_1'],
+                           compute_cultivar_trends(location_store, 'wheat', 'yield_metric_1')['mean-yield_metric_1'])
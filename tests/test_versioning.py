@@ -0,0 +1,97 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic_data import make_catalog, make_trial_data
+from helpers.data_exporting import selection_file_name
+from helpers.data_versioning import (compute_rank_diff, diff_versions, get_drivers, list_versions, save_version)
+
+WEIGHTS = [12] * 8
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return make_catalog(metrics_per_category=2)
+
+
+@pytest.fixture(scope='module')
+def trial_data(catalog):
+    data_frame = make_trial_data(catalog, n_cultivars=12, n_locations=2, n_seasons=2, n_plots=2)
+    # seasons are stored like '2020/2021' in the sheets
+    data_frame['season'] = data_frame['season'].map(lambda x: f'{x}/{x + 1}')
+    return data_frame
+
+
+def boost_cultivar(data_frame, cultivar, location, metric, delta):
+    data_frame = data_frame.copy()
+    data_frame.loc[(data_frame.genotype == cultivar) & (data_frame.location == location), metric] += delta
+    return data_frame
+
+
+def test_selection_file_name():
+    assert selection_file_name(('wheat', 'location 0', '2020/2021')) == 'wheat-location_0-2020_2021'
+
+
+def test_save_version_keeps_ingest_order(tmp_path, catalog, trial_data):
+    changed = boost_cultivar(trial_data, 'cultivar_0', 'location_0', 'yield_metric_1', 100)
+    first = save_version(tmp_path, trial_data, catalog)
+    assert save_version(tmp_path, trial_data, catalog) == first
+    second = save_version(tmp_path, changed, catalog)
+    assert [x['version'] for x in list_versions(tmp_path)] == [first, second]
+
+    # reverting to stored content moves it to the end without storing it again
+    assert save_version(tmp_path, trial_data, catalog) == first
+    assert [x['version'] for x in list_versions(tmp_path)] == [second, first]
+
+
+def test_get_drivers():
+    old = pd.DataFrame({'rank-a': [1, 2], 'rank-b': [1, 2], 'rank-c': [1, 2]}, index=['x', 'y'])
+    new = pd.DataFrame({'rank-a': [2, 2], 'rank-b': [4, 2], 'rank-d': [1, 1]}, index=['x', 'y'])
+
+    drivers = get_drivers(old, new, pd.Index(['x', 'y', 'z']))
+    # largest moves first, metrics missing in either version and unchanged metrics are left out
+    assert drivers.tolist() == ['b (+3), a (+1)', '', '']
+
+
+def make_category_results(rank_by_category):
+    """{category: (metrics, ranks)} with the given overall ranks per category."""
+    results = {}
+    for category, ranks in rank_by_category.items():
+        cultivars = list(ranks)
+        df_rank = pd.DataFrame({'cultivar': cultivars,
+                                f'rank-{category}_metric': list(ranks.values()),
+                                f'overall_rank-{category}': list(ranks.values())})
+        results[category] = (df_rank[['cultivar']], df_rank)
+    return results
+
+
+def test_compute_rank_diff():
+    old = make_category_results({'yield': {'a': 1, 'b': 2, 'c': 3}, 'quality': {'a': 1, 'b': 2, 'c': 3}})
+    new = make_category_results({'yield': {'a': 3, 'b': 2, 'c': 1, 'd': 4},
+                                 'quality': {'a': 3, 'b': 2, 'c': 1, 'd': 4}})
+
+    diff = compute_rank_diff(old, new, [1, 1])
+    assert diff.cultivar.tolist() == ['a', 'c', 'd']
+    assert diff.set_index('cultivar')['delta'].loc[['a', 'c']].tolist() == [2, -2]
+    assert np.isnan(diff.set_index('cultivar').loc['d', 'old_rank'])
+    assert diff.set_index('cultivar').loc['a', 'drivers'] == 'yield_metric (+2), quality_metric (+2)'
+
+
+def test_diff_versions_ranks_only_changed_selections(tmp_path, catalog, trial_data):
+    changed = boost_cultivar(trial_data, 'cultivar_0', 'location_0', 'yield_metric_1', 100)
+    old_version = save_version(tmp_path, trial_data, catalog)
+    new_version = save_version(tmp_path, changed, catalog)
+
+    with open(diff_versions(tmp_path, old_version, new_version, {'equal': WEIGHTS})) as f:
+        diffs = json.load(f)['diffs']
+
+    # only the two location_0 selections changed: each is ranked in both versions
+    assert len(os.listdir(tmp_path / 'ranks')) == 4
+    assert {x['selection'] for x in diffs} <= {'wheat-location_0-2020/2021', 'wheat-location_0-2021/2022'}
+    # yield_metric_1 ranks ascending: the boosted cultivar can only drop
+    moved = [x for diff in diffs for x in diff['moved'] if x['cultivar'] == 'cultivar_0']
+    assert len(moved) > 0
+    assert all(x['delta'] > 0 and 'yield_metric_1' in x['drivers'] for x in moved)